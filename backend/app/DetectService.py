@@ -1,6 +1,8 @@
 import os
 import io
 import json
+import asyncio
+import hashlib
 from typing import List, Dict, Optional
 from fastapi import UploadFile, HTTPException
 from PIL import Image
@@ -8,6 +10,8 @@ from dotenv import load_dotenv
 from rapidfuzz import process as rf_process, fuzz as rf_fuzz
 import google.generativeai as genai
 from pydantic import BaseModel, Field
+from . import cassettes, barcode, resilience
+from .metrics import timed, BARCODE_FASTPATH
 
 
 class ProductModel(BaseModel):
@@ -15,6 +19,7 @@ class ProductModel(BaseModel):
     brand: Optional[str] = None
     manufacturer_or_company: Optional[str] = None
     category: Optional[str] = None
+    upc: Optional[str] = None
     
 
 
@@ -34,7 +39,13 @@ api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
     raise RuntimeError("Set GEMINI_API_KEY in .env")
 
-genai.configure(api_key=api_key)
+# GEMINI_API_ENDPOINT points the SDK at another host (e.g. the load-test fake); REST transport
+# is used then so plain http:// endpoints work
+gemini_endpoint = os.getenv("GEMINI_API_ENDPOINT")
+if gemini_endpoint:
+    genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": gemini_endpoint})
+else:
+    genai.configure(api_key=api_key)
 gem_model = genai.GenerativeModel("gemini-2.5-flash")
 
 
@@ -80,7 +91,34 @@ def read_image_bytes(upload: UploadFile) -> bytes:
         return raw
 
 
-def detect_ingredients(image_bytes: bytes) -> Dict:
+async def _detect_from_barcode(image_bytes: bytes) -> tuple[Optional[str], Optional[DetectionResultModel]]:
+    """Barcode fast path. Returns (decoded UPC or None, catalog detection or None)."""
+    try:
+        with timed("barcode_decode"):
+            upc = await asyncio.to_thread(barcode.decode_upc, image_bytes)
+    except Exception as e:
+        print("Barcode decode failed:", e)
+        BARCODE_FASTPATH.labels(result="error").inc()
+        return None, None
+    if not upc:
+        BARCODE_FASTPATH.labels(result="no_barcode").inc()
+        return None, None
+
+    entry = await barcode.lookup(upc)
+    if not entry:
+        BARCODE_FASTPATH.labels(result="miss").inc()
+        return upc, None
+
+    BARCODE_FASTPATH.labels(result="hit").inc()
+    return upc, DetectionResultModel(
+        product=ProductModel(**{**entry["product"], "upc": upc}),
+        research_queries=entry.get("research_queries", []),
+        evidence=EvidenceModel(**(entry.get("evidence") or {})),
+        confidence=entry.get("confidence", 0.0),
+    )
+
+
+async def detect_ingredients(image_bytes: bytes) -> Dict:
     """
     Detect ingredients from image using Gemini Vision API.
     
@@ -110,6 +148,7 @@ def detect_ingredients(image_bytes: bytes) -> Dict:
     "\"brand\": string|null,"
     "\"manufacturer_or_company\": string|null,"
     "\"category\": string|null,"
+    "\"upc\": string|null,"
     "\"research_queries\": [string],"
     "\"evidence\": {"
       "\"product_name_text\": string|null,"
@@ -125,14 +164,33 @@ def detect_ingredients(image_bytes: bytes) -> Dict:
 )
 
 
+    # A decoded UPC that is already in our catalog skips the vision call entirely
+    upc, known = await _detect_from_barcode(image_bytes)
+    if known is not None:
+        return known
+
     image_part = {"inline_data": {"mime_type": "image/jpeg", "data": image_bytes}}
     
     try:
-        resp = gem_model.generate_content(
-            [prompt, image_part],
-            generation_config={"response_mime_type": "application/json"}
-        )
-        data = json.loads(resp.text)
+        async def call():
+            # The Gemini SDK call is blocking; keep it off the event loop
+            resp = await asyncio.to_thread(
+                gem_model.generate_content,
+                [prompt, image_part],
+                generation_config={"response_mime_type": "application/json"}
+            )
+            return resp.text
+
+        cassette_request = {
+            "model": gem_model.model_name,
+            "prompt": prompt,
+            "image_sha256": hashlib.sha256(image_bytes).hexdigest(),
+        }
+        data = json.loads(await cassettes.through(
+            "gemini", cassette_request, lambda: resilience.call("gemini", call)
+        ))
+    except resilience.CircuitOpen as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(max(1, int(e.retry_after)))})
     except Exception as e:
         raise HTTPException(500, f"Vision model error: {e}")
 
@@ -141,15 +199,27 @@ def detect_ingredients(image_bytes: bytes) -> Dict:
     filled_fields = sum(1 for f in fields_to_check if data.get(f))
     confidence = filled_fields / len(fields_to_check)
     
-    return DetectionResultModel(
+    result = DetectionResultModel(
         product=ProductModel(
             product_name=data.get("product_name"),
             brand=data.get("brand"),
             manufacturer_or_company=data.get("manufacturer_or_company"),
             category=data.get("category"),
-            
+            # Prefer the locally decoded code over the model's reading of the digits
+            upc=upc or (barcode.normalize_upc(data["upc"]) if data.get("upc") else None),
         ),
         research_queries=data.get("research_queries", []),
         evidence=EvidenceModel(**data.get("evidence", {})),
         confidence=confidence
-    )
\ No newline at end of file
+    )
+
+    # Catalog the product so the next scan of this barcode takes the fast path. Only a
+    # locally decoded (checksum-verified) code is trusted as a key; the model's reading
+    # of the digits stays on this detection alone.
+    if upc:
+        try:
+            await barcode.remember(upc, result.model_dump())
+        except Exception as e:
+            print("Failed to update product catalog:", e)
+
+    return result
\ No newline at end of file
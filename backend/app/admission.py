@@ -0,0 +1,130 @@
+"""
+Admission control for /report-json.
+
+- a global cap on pipelines in flight (Gemini + Perplexity + Groq chains)
+- a bounded wait queue; once it is full callers get 429 with Retry-After
+- a token bucket per user (keyed on the auth `sub`), and a separate one for
+  /report-batch images so one shelf upload does not need a burst of 50 reports
+"""
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from fastapi import HTTPException
+
+from .metrics import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_QUEUE_WAIT,
+    ADMISSION_REJECTED,
+)
+
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "0.2"))    # reports per second per user
+USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "5"))
+BATCH_RATE = float(os.getenv("ADMISSION_BATCH_RATE", "0.05"))  # batch images per second per user
+BATCH_BURST = float(os.getenv("ADMISSION_BATCH_BURST", "50"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, n: float = 1) -> float:
+        """Take n tokens. Returns 0 on success, otherwise seconds until they are available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+def _too_many(detail: str, retry_after: float) -> HTTPException:
+    seconds = max(1, math.ceil(retry_after)) if math.isfinite(retry_after) else 60
+    return HTTPException(429, detail, headers={"Retry-After": str(seconds)})
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float,
+                 user_rate: float, user_burst: float, batch_rate: float, batch_burst: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.batch_rate = batch_rate
+        self.batch_burst = batch_burst
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._waiting = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._batch_buckets: Dict[str, TokenBucket] = {}
+        # EWMA of how long a pipeline holds a slot, used for Retry-After hints
+        self._avg_service = 30.0
+
+    def check_rate(self, user_id: str) -> None:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        wait = bucket.take()
+        if wait > 0:
+            ADMISSION_REJECTED.labels(reason="rate_limited").inc()
+            raise _too_many("Too many reports, slow down", wait)
+
+    def check_batch_rate(self, user_id: str, images: int) -> None:
+        """Charge a batch one token per image from the user's batch allowance."""
+        if images > self.batch_burst:
+            raise HTTPException(400, f"At most {int(self.batch_burst)} batch images at once")
+        bucket = self._batch_buckets.get(user_id)
+        if bucket is None:
+            bucket = self._batch_buckets[user_id] = TokenBucket(self.batch_rate, self.batch_burst)
+        wait = bucket.take(images)
+        if wait > 0:
+            ADMISSION_REJECTED.labels(reason="rate_limited").inc()
+            raise _too_many("Too many batch images, slow down", wait)
+
+    def _retry_after(self) -> float:
+        # Roughly: how long until the queue ahead of a new caller has drained
+        return self._avg_service * (self._waiting + 1) / self.max_in_flight
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one pipeline slot for the duration of the block."""
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            ADMISSION_REJECTED.labels(reason="queue_full").inc()
+            raise _too_many("Server busy, try again later", self._retry_after())
+
+        self._waiting += 1
+        ADMISSION_QUEUE_DEPTH.set(self._waiting)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTED.labels(reason="queue_timeout").inc()
+            raise _too_many("Server busy, try again later", self._retry_after())
+        finally:
+            self._waiting -= 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting)
+        ADMISSION_QUEUE_WAIT.observe(time.monotonic() - queued_at)
+
+        ADMISSION_IN_FLIGHT.inc()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._slots.release()
+            ADMISSION_IN_FLIGHT.dec()
+            self._avg_service = 0.8 * self._avg_service + 0.2 * (time.monotonic() - started)
+
+
+admission = AdmissionController(MAX_IN_FLIGHT, MAX_QUEUE, QUEUE_TIMEOUT, USER_RATE, USER_BURST,
+                                BATCH_RATE, BATCH_BURST)
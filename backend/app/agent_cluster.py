@@ -0,0 +1,116 @@
+"""
+Run the agents as separate processes: one detect Bureau plus N deep_search and
+M writer instances, each in its own Bureau (see agent_registry.py).
+
+    cd backend
+    python -m app.agent_cluster --deep-search 4 --writer 2
+
+detect_agent keeps port 8000 (DETECT_AGENT_SUBMIT is unchanged); deep_search
+instance i listens on 8100+i and writer instance i on 8200+i, with Prometheus
+exporters on 9100, 9200+i and 9300+i.
+
+On Ctrl-C / SIGTERM the launcher stops the pipeline front to back: detect first
+(no new work), then the deep_search instances, then the writers. Each stage is
+drained through the registry (agent_registry.drain) before it is signalled, so
+nothing it still holds, or forwards to the next stage, is lost when its Bureau
+shuts down. The instances run in their own sessions, so a terminal Ctrl-C
+reaches only the launcher.
+
+Scheduler buckets are per process (scheduler.py), so each instance gets an
+equal share of SCHEDULER_<UPSTREAM>_RATE / _BURST for the upstream its role
+calls: Perplexity for deep_search, Groq for the writer.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from . import agent_registry
+from .scheduler import DEFAULT_LIMITS
+
+ROLE_PORTS = {"deep_search": (8100, 9200), "writer": (8200, 9300)}
+ROLE_UPSTREAMS = {"deep_search": ("perplexity",), "writer": ("groq",)}
+
+
+def _quota_share(role: str, instances: int) -> Dict[str, str]:
+    """Scheduler settings giving one of `instances` processes its share of the role's upstream quotas."""
+    env = {}
+    for upstream in ROLE_UPSTREAMS.get(role, ()):
+        prefix = f"SCHEDULER_{upstream.upper()}"
+        rate, burst = DEFAULT_LIMITS[upstream]
+        rate = float(os.getenv(f"{prefix}_RATE", str(rate)))
+        burst = float(os.getenv(f"{prefix}_BURST", str(burst)))
+        env[f"{prefix}_RATE"] = str(rate / instances)   # 0 (unlimited) stays 0
+        env[f"{prefix}_BURST"] = str(max(1.0, burst / instances))   # a call needs one whole token
+    return env
+
+
+def _spawn(role: str, instance: int, port: int, metrics_port: int, instances: int = 1) -> subprocess.Popen:
+    env: Dict[str, str] = dict(
+        os.environ,
+        AGENT_ROLE=role,
+        AGENT_INSTANCE=str(instance),
+        BUREAU_PORT=str(port),
+        BUREAU_METRICS_PORT=str(metrics_port),
+        **_quota_share(role, instances),
+    )
+    # Own session: the launcher decides when an instance gets its SIGINT (see stop())
+    return subprocess.Popen([sys.executable, "-m", "app.agents"], env=env, start_new_session=True)
+
+
+def _interrupt(procs: List[subprocess.Popen]) -> None:
+    for p in procs:
+        if p.poll() is None:
+            p.send_signal(signal.SIGINT)   # the Bureau's shutdown handlers deregister
+
+
+def stop(procs: Dict[str, List[subprocess.Popen]]) -> None:
+    _interrupt(procs["detect"])
+    for role in ("deep_search", "writer"):
+        alive = [p for p in procs[role] if p.poll() is None]
+        if alive:
+            print(f"Draining {len(alive)} {role} instance(s)")
+            left = agent_registry.drain([p.pid for p in alive])
+            if left:
+                print(f"{role}: {left} messages still in flight after {agent_registry.AGENT_DRAIN_SECONDS:g}s")
+        _interrupt(alive)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deep-search", type=int, default=2, help="deep_search_agent instances")
+    parser.add_argument("--writer", type=int, default=2, help="writer_agent instances")
+    args = parser.parse_args()
+
+    procs: Dict[str, List[subprocess.Popen]] = {"detect": [_spawn("detect", 0, 8000, 9100)]}
+    for role, count in (("deep_search", args.deep_search), ("writer", args.writer)):
+        port, metrics_port = ROLE_PORTS[role]
+        procs[role] = [_spawn(role, i, port + i, metrics_port + i, count) for i in range(count)]
+    everyone = [p for group in procs.values() for p in group]
+
+    def interrupt(*_):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        while all(p.poll() is None for p in everyone):
+            time.sleep(1)
+        print("An agent process exited; stopping the cluster")
+    except KeyboardInterrupt:
+        pass
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # a second Ctrl-C must not cut the drain short
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    stop(procs)
+    deadline = time.monotonic() + 10
+    for p in everyone:
+        try:
+            p.wait(timeout=max(0.1, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
-from groq import Groq
+from groq import AsyncGroq
 from dotenv import load_dotenv
 import os
 import re
+from . import cassettes, resilience
 load_dotenv()
-client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+# Async client so the writer never blocks the event loop it runs on
+client = AsyncGroq(api_key=os.getenv('GROQ_API_KEY'), base_url=os.getenv('GROQ_BASE_URL'))
 
 async def write_summary(msg): 
     writing_prompt = f"""You are a risk intelligence analyst generating a standardized, executive-ready,
@@ -24,10 +26,11 @@ INPUTS (PROVIDED EACH RUN)
 - Product name : "{msg['product_name']}"
 - Cleaned Evidence :"{msg['cleaned_evidence']}"
 - Aggregated answers :"{msg['aggregated_answers']}"
-- All sources : "{msg['all_sources']}"
+- All sources (source id -> URL) : "{msg['all_sources']}"
 - Confidence : "{msg['confidence']}"
 
 Do NOT invent facts, infer legal conclusions, or speculate beyond the provided data.
+Sources in the evidence are referenced by source id; cite them by the same ids.
 
 ========================
 OUTPUT REQUIREMENTS
@@ -176,20 +179,20 @@ Before finalizing output, internally verify that all constraints are satisfied.
       {{
         "bullet": "<string>",
         "status": "<string|null>",
-        "source_urls": ["<string>"]
+        "source_ids": ["<source id>"]
       }}
     ],
     "recalls": [
       {{
         "bullet": "<string>",
         "scope": "<string|null>",
-        "source_urls": ["<string>"]
+        "source_ids": ["<source id>"]
       }}
     ],
     "warnings": [
       {{
         "bullet": "<string>",
-        "source_urls": ["<string>"]
+        "source_ids": ["<source id>"]
       }}
     ]
   }},
@@ -232,16 +235,25 @@ Return ONLY valid JSON. No markdown.
 
 """
     
-    response = client.chat.completions.create(
-        model="moonshotai/kimi-k2-instruct-0905",  # Updated model
-        messages=[
-            {"role": "system", "content": "You are a risk intelligence analyst. Return ONLY valid JSON. No markdown."},
-            {"role": "user", "content": writing_prompt}
-        ],
-        max_tokens=1200
-    )
-    
-    result = response.choices[0].message.content.strip()
+    model = "moonshotai/kimi-k2-instruct-0905"  # Updated model
+
+    async def call():
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are a risk intelligence analyst. Return ONLY valid JSON. No markdown."},
+                {"role": "user", "content": writing_prompt}
+            ],
+            max_tokens=1200
+        )
+        return response.choices[0].message.content
+
+    # Key on the writer inputs, not the prompt text: the prompt embeds request_id/callback_url
+    cassette_request = {
+        "model": model,
+        "inputs": {k: v for k, v in msg.items() if k not in ("request_id", "callback_url")},
+    }
+    result = (await cassettes.through("groq", cassette_request, lambda: resilience.call("groq", call))).strip()
     return result
 
 
@@ -0,0 +1,180 @@
+"""
+Registry and load balancing for horizontally scaled agents.
+
+Every deep_search / writer instance (one Bureau process each, see
+agent_cluster.py) registers its address and endpoint in the agent_registry
+collection on startup and heartbeats its in-flight count. Senders pick an
+instance per message:
+
+    AGENT_LB_STRATEGY=least_outstanding   fewest in-flight (reported + sent since)
+    AGENT_LB_STRATEGY=consistent_hash     hash ring on request_id (stable under resizes)
+
+The launcher drains an instance before stopping it (drain()): it marks it
+draining so no new work is routed to it, waits up to AGENT_DRAIN_SECONDS for its
+heartbeats to report nothing in flight, and only then signals the process, which
+deregisters on shutdown. Draining has to happen from outside: by the time a
+Bureau runs its shutdown handlers it has already stopped its server and message
+queue. Instances that stop heartbeating drop out after REGISTRY_STALE_SECONDS.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import socket
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .db import client
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+AGENT_LB_STRATEGY = os.getenv("AGENT_LB_STRATEGY", "least_outstanding")
+REGISTRY_HEARTBEAT_SECONDS = float(os.getenv("REGISTRY_HEARTBEAT_SECONDS", "2"))
+REGISTRY_STALE_SECONDS = float(os.getenv("REGISTRY_STALE_SECONDS", "10"))
+REGISTRY_REFRESH_SECONDS = float(os.getenv("REGISTRY_REFRESH_SECONDS", "1"))
+AGENT_DRAIN_SECONDS = float(os.getenv("AGENT_DRAIN_SECONDS", "60"))
+HASH_VNODES = 64
+HOSTNAME = socket.gethostname()
+
+registry = client[DB_NAME]["agent_registry"]
+
+try:
+    registry.create_index("address", unique=True)
+    # Crashed instances never deregister; drop their entries eventually
+    registry.create_index("heartbeat_at", expireAfterSeconds=300)
+except Exception as e:
+    print("Failed to create agent_registry indexes:", e)
+
+# This process's instances: address -> in-flight messages
+_in_flight: Dict[str, int] = defaultdict(int)
+
+# Sender-side view of the other instances
+_members: Dict[str, List[Dict[str, Any]]] = {}
+_loaded_at: Dict[str, float] = {}
+_sent_since_heartbeat: Dict[str, int] = defaultdict(int)
+_last_heartbeat: Dict[str, datetime] = {}
+
+
+# ---------------------------------------------------------------------------
+# Instance side
+# ---------------------------------------------------------------------------
+
+async def register(address: str, role: str, endpoint: str) -> None:
+    now = datetime.utcnow()
+    await asyncio.to_thread(
+        registry.update_one,
+        {"address": address},
+        {"$set": {
+            "address": address, "role": role, "endpoint": endpoint, "status": "active",
+            "in_flight": 0, "heartbeat_at": now, "started_at": now,
+            # lets the launcher on this host find its children's entries (drain())
+            "host": HOSTNAME, "pid": os.getpid(),
+        }},
+        upsert=True,
+    )
+
+
+async def heartbeat(address: str) -> None:
+    await asyncio.to_thread(
+        registry.update_one,
+        {"address": address},
+        {"$set": {"in_flight": _in_flight[address], "heartbeat_at": datetime.utcnow()}},
+    )
+
+
+@contextmanager
+def track(address: str):
+    """Count a message as in flight on this instance while it is handled."""
+    _in_flight[address] += 1
+    try:
+        yield
+    finally:
+        _in_flight[address] -= 1
+
+
+async def leave(address: str, logger=None) -> None:
+    if logger and _in_flight[address] > 0:
+        logger.info(f"Leaving with {_in_flight[address]} messages still in flight")
+    await asyncio.to_thread(registry.delete_one, {"address": address})
+
+
+# ---------------------------------------------------------------------------
+# Launcher side
+# ---------------------------------------------------------------------------
+
+def drain(pids: List[int], timeout: float = AGENT_DRAIN_SECONDS) -> int:
+    """Stop routing work to this host's instances `pids` and wait until they are idle.
+
+    Idle means two heartbeats in a row report nothing in flight, both sent after senders
+    have refreshed their member lists (messages they sent before that are counted
+    by then). Returns the in-flight total left at the deadline (0 when drained).
+    """
+    query = {"host": HOSTNAME, "pid": {"$in": pids}}
+    registry.update_many(query, {"$set": {"status": "draining"}})
+    settled = datetime.utcnow() + timedelta(seconds=REGISTRY_REFRESH_SECONDS)
+    deadline = time.monotonic() + timeout
+    idle_polls, left = 0, 0
+    while True:
+        docs = list(registry.find(query, {"in_flight": 1, "heartbeat_at": 1}))
+        left = sum(d.get("in_flight", 0) for d in docs)
+        fresh = all(d["heartbeat_at"] > settled for d in docs)
+        idle_polls = idle_polls + 1 if fresh and left == 0 else 0
+        if idle_polls >= 2 or time.monotonic() >= deadline:
+            return left
+        time.sleep(REGISTRY_HEARTBEAT_SECONDS)
+
+
+# ---------------------------------------------------------------------------
+# Sender side
+# ---------------------------------------------------------------------------
+
+async def instances(role: str) -> List[Dict[str, Any]]:
+    """Active, recently heartbeating instances of `role` (cached for REGISTRY_REFRESH_SECONDS)."""
+    if time.monotonic() - _loaded_at.get(role, 0) > REGISTRY_REFRESH_SECONDS:
+        fresh_after = datetime.utcnow() - timedelta(seconds=REGISTRY_STALE_SECONDS)
+        docs = await asyncio.to_thread(lambda: list(registry.find(
+            {"role": role, "status": "active", "heartbeat_at": {"$gte": fresh_after}}, {"_id": 0}
+        )))
+        for d in docs:
+            # A new heartbeat already counts what we sent before it
+            if _last_heartbeat.get(d["address"]) != d["heartbeat_at"]:
+                _last_heartbeat[d["address"]] = d["heartbeat_at"]
+                _sent_since_heartbeat[d["address"]] = 0
+        _members[role] = sorted(docs, key=lambda d: d["address"])
+        _loaded_at[role] = time.monotonic()
+    return _members.get(role, [])
+
+
+def _ring_position(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], "big")
+
+
+def _by_hash(members: List[Dict[str, Any]], key: str) -> Dict[str, Any]:
+    ring = sorted(
+        (_ring_position(f"{m['address']}#{v}"), i)
+        for i, m in enumerate(members) for v in range(HASH_VNODES)
+    )
+    points = [p for p, _ in ring]
+    idx = bisect.bisect(points, _ring_position(key)) % len(ring)
+    return members[ring[idx][1]]
+
+
+def _least_outstanding(members: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return min(members, key=lambda m: m.get("in_flight", 0) + _sent_since_heartbeat[m["address"]])
+
+
+async def pick(role: str, key: str) -> Optional[Dict[str, Any]]:
+    """Instance to send the next `role` message to, or None when none is registered."""
+    members = await instances(role)
+    if not members:
+        return None
+    chosen = _by_hash(members, key) if AGENT_LB_STRATEGY == "consistent_hash" else _least_outstanding(members)
+    _sent_since_heartbeat[chosen["address"]] += 1
+    return chosen
+
+
+def forget(role: str, address: str) -> None:
+    """Stop picking an instance that refused a message until the next refresh shows it again."""
+    _members[role] = [m for m in _members.get(role, []) if m["address"] != address]
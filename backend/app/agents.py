@@ -3,15 +3,58 @@ Simple and clean agents configuration - Product Safety Detection System
 Flow: test_agent -> detect_agent -> deep_search_agent -> writer_agent
 """
 from uagents import Agent, Bureau, Context, Model
+from uagents_core.identity import Identity
 from typing import List, Dict, Optional, Any
 from dotenv import load_dotenv
 import os
 import httpx
 import asyncio
+import logging
+import time
 from .agent_function import *
+from .codec import pack, unpack, build_envelope
+from .checkpoints import save_checkpoint, load_checkpoint
+from .metrics import timed, SHARED_SEARCH_HITS, RESEARCH_QUERIES, DEEP_SEARCH_STOPS
+from .query_planner import plan_queries
+from . import cassettes
+from . import sources as source_store
+from . import outbox
+from . import resilience
+from . import agent_registry
+from .scheduler import work_class
+from .tracing import span, current_traceparent
 import json
 load_dotenv()
 
+# Used when the stages run outside a uAgents Context (in-process mode)
+log = logging.getLogger("agents")
+
+# Writer evidence above this many encoded bytes is stored as a stage checkpoint
+# and passed by id instead of inline
+INLINE_PAYLOAD_LIMIT = int(os.getenv("INLINE_PAYLOAD_LIMIT", "16384"))
+
+# Deep search stops once an answer adds less than DEEP_SEARCH_MIN_GAIN new evidence
+# (after DEEP_SEARCH_MIN_QUERIES answers) or DEEP_SEARCH_TIME_BUDGET seconds are spent
+DEEP_SEARCH_MIN_GAIN = float(os.getenv("DEEP_SEARCH_MIN_GAIN", "0.5"))
+DEEP_SEARCH_MIN_QUERIES = int(os.getenv("DEEP_SEARCH_MIN_QUERIES", "2"))
+DEEP_SEARCH_TIME_BUDGET = float(os.getenv("DEEP_SEARCH_TIME_BUDGET", "25"))
+
+# Horizontal scaling (agent_registry.py, agent_cluster.py): a process runs the agents
+# of AGENT_ROLE (all | detect | deep_search | writer) in its own Bureau. Instance 0
+# keeps the original seeds, so single-process addresses do not change.
+AGENT_ROLE = os.getenv("AGENT_ROLE", "all")
+AGENT_INSTANCE = int(os.getenv("AGENT_INSTANCE", "0"))
+BUREAU_HOST = os.getenv("BUREAU_HOST", "127.0.0.1")
+BUREAU_PORT = int(os.getenv("BUREAU_PORT", "8000"))
+BUREAU_ENDPOINT = f"http://{BUREAU_HOST}:{BUREAU_PORT}/submit"
+
+def _seed(base: str) -> str:
+    return base if AGENT_INSTANCE == 0 else f"{base} {AGENT_INSTANCE}"
+
+DETECT_SEED = "detect agent seed"
+DEEP_SEARCH_SEED = _seed("deep search agent seed")
+WRITER_SEED = _seed("writer agent seed")
+
 # ============================================================================
 # Models
 # ============================================================================
@@ -20,11 +63,22 @@ class DetectionInput(Model):
     detection_result: Dict[str, Any]
     request_id: str
     callback_url: str
+    traceparent: Optional[str] = None
+    # Upstream scheduling class (scheduler.py): interactive | batch | warm
+    priority: str = "interactive"
+    user_id: Optional[str] = None
+    # API-side stage timings (upload, detection, insert); they travel with the
+    # report so the completion webhook stores them in its single write
+    timings: Dict[str, float] = {}
 
 class DeepSearchRequest(Model):
     detection_result: Dict[str, Any]
     request_id: str
     callback_url: str
+    timings: Dict[str, float] = {}
+    traceparent: Optional[str] = None
+    priority: str = "interactive"
+    user_id: Optional[str] = None
 
 
 
@@ -39,7 +93,7 @@ class CleanedEvidence(Model):
 class DeepSearchResponse(Model):
     cleaned_evidence: CleanedEvidence
     aggregated_answers: List[str] = []
-    all_sources: List[Dict[str, Any]] = []
+    all_sources: List[str] = []   # source ids (see sources.py)
     confidence: float = 0.0
 class WriterRequest(Model):
     request_id: str
@@ -47,8 +101,17 @@ class WriterRequest(Model):
     product_name: str
     cleaned_evidence: CleanedEvidence
     aggregated_answers: List[str] = []
-    all_sources: List[Dict[str, Any]] = []
+    all_sources: List[str] = []   # source ids; evidence "sources" lists hold ids too
     confidence: float = 0.0
+    # Compact forms of the evidence fields above, used between agents
+    evidence_blob: Optional[str] = None   # codec.pack() of the evidence
+    evidence_ref: Optional[str] = None    # stage checkpoint id
+    timings: Dict[str, float] = {}
+    traceparent: Optional[str] = None
+    priority: str = "interactive"
+    user_id: Optional[str] = None
+    # planned / run / stop_reason / gains of the deep search, stored on the report
+    search_stats: Dict[str, Any] = {}
 
 class WriterResponse(Model):
     final_report: Dict[str, Any]
@@ -107,26 +170,65 @@ class WriterResponse(Model):
 
 detect_agent = Agent(
     name="detect_agent",
-    seed="detect agent seed",
+    seed=DETECT_SEED,
     port=8001,
     endpoint=["http://127.0.0.1:8001/submit"],
 )
 
-@detect_agent.on_message(model=DetectionInput)
-async def handle_detection(ctx: Context, sender: str, msg: DetectionInput):
+def run_detection(msg: DetectionInput, logger=log) -> DeepSearchRequest:
+    """Detect stage: turn the API's detection into a deep search request."""
     detection_dict = msg.detection_result
     product_name = detection_dict.get("product", {}).get("product_name", "Unknown")
-    ctx.logger.info(f"🔍 Detect got product: {product_name}")
-
-    await ctx.send(
-        deep_search_agent.address,
-        DeepSearchRequest(
-            detection_result=detection_dict,
-            request_id=msg.request_id,
-            callback_url=msg.callback_url,
-        )
+    logger.info(f"🔍 Detect got product: {product_name}")
+
+    return DeepSearchRequest(
+        detection_result=detection_dict,
+        request_id=msg.request_id,
+        callback_url=msg.callback_url,
+        timings=dict(msg.timings),
+        traceparent=current_traceparent() or msg.traceparent,
+        priority=msg.priority,
+        user_id=msg.user_id,
     )
 
+# Agents running in this process's Bureau; messages to them skip the HTTP hop
+LOCAL_ADDRESSES = set()
+
+async def send_balanced(ctx: Context, role: str, sender_seed: str, msg: Model, fallback: str) -> None:
+    """Send msg to a registered instance of `role` (agent_registry.pick on request_id).
+
+    Remote instances get a signed envelope POSTed to their Bureau; an instance that
+    refuses it is skipped until the registry is next read. With no instance registered the
+    message goes to `fallback` (the instance-0 agent) as before.
+    """
+    for _ in range(2):
+        try:
+            target = await agent_registry.pick(role, msg.request_id)
+        except Exception as e:
+            ctx.logger.info(f"Agent registry unavailable, using {role} instance 0: {e}")
+            target = None
+        if target is None or target["address"] in LOCAL_ADDRESSES:
+            await ctx.send(target["address"] if target else fallback, msg)
+            return
+        envelope = build_envelope(msg, target["address"], Identity.from_seed(sender_seed, 0))
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                r = await client.post(target["endpoint"], json=envelope)
+            if r.status_code < 300:
+                return
+            ctx.logger.info(f"{role} instance {target['address']} refused message: {r.status_code}")
+        except httpx.HTTPError as e:
+            ctx.logger.info(f"{role} instance {target['address']} unreachable: {e}")
+        agent_registry.forget(role, target["address"])
+    await ctx.send(fallback, msg)
+
+@detect_agent.on_message(model=DetectionInput)
+async def handle_detection(ctx: Context, sender: str, msg: DetectionInput):
+    with span("detect_agent.handle", parent=msg.traceparent, request_id=msg.request_id), \
+            work_class(msg.priority, msg.user_id):
+        await send_balanced(ctx, "deep_search", DETECT_SEED, run_detection(msg, ctx.logger),
+                            deep_search_agent.address)
+
 
 @detect_agent.on_event("startup")
 async def detect_startup(ctx: Context):
@@ -138,18 +240,32 @@ async def detect_startup(ctx: Context):
 
 deep_search_agent = Agent(
     name="deep_search_agent",
-    seed="deep search agent seed",
+    seed=DEEP_SEARCH_SEED,
     port=8002,
     endpoint=["http://127.0.0.1:8002/submit"],
 )
 
+def normalize_sources(raw_sources: List[Any]) -> List[Dict[str, Any]]:
+    """Normalize citations (plain URLs, dicts or anything else) to source dicts."""
+    sources = []
+    for source in raw_sources:
+        if isinstance(source, dict):
+            sources.append(source)
+        elif isinstance(source, str):
+            # Convert string to dict
+            sources.append({"url": source, "title": source})
+        else:
+            # Convert other types to dict
+            sources.append({"source": str(source)})
+    return sources
+
 async def perplexity_search(query: str) -> tuple[str, List[Dict[str, Any]]]:
     """Search using Perplexity API"""
     api_key = os.getenv("PREPLEXITY_API_KEY")
-    if not api_key:
+    if not api_key and cassettes.CASSETTE_MODE != "replay":
         return "API key not found", []
     
-    url = "https://api.perplexity.ai/chat/completions"
+    url = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -172,54 +288,52 @@ async def perplexity_search(query: str) -> tuple[str, List[Dict[str, Any]]]:
         "max_tokens": 1000
     }
     
-    try:
-        import httpx
+    async def call():
         async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.post(url, json=payload, headers=headers)
-            
-            # Get error details if request failed
-            if response.status_code != 200:
-                error_text = response.text
-                try:
-                    error_json = response.json()
-                    error_msg = error_json.get("error", {}).get("message", error_text)
-                    error_type = error_json.get("error", {}).get("type", "unknown")
-                    return f"Perplexity API Error ({response.status_code}): {error_type} - {error_msg}", []
-                except:
-                    return f"Perplexity API Error ({response.status_code}): {error_text[:200]}", []
-            
-            # Success - parse response
-            data = response.json()
-            
-            # Extract answer
-            answer = data.get("choices", [{}])[0].get("message", {}).get("content", "No answer found.")
-            
-            # Extract sources/citations and normalize to dicts
-            sources = []
-            raw_sources = []
-            
-            if "citations" in data:
-                raw_sources = data["citations"]
-            elif "sources" in data:
-                raw_sources = data["sources"]
-            elif "choices" in data and len(data["choices"]) > 0:
-                # Sometimes citations are in the choice
-                choice = data["choices"][0]
-                if "citations" in choice:
-                    raw_sources = choice["citations"]
-            
-            # Normalize sources to dictionaries
-            for source in raw_sources:
-                if isinstance(source, dict):
-                    sources.append(source)
-                elif isinstance(source, str):
-                    # Convert string to dict
-                    sources.append({"url": source, "title": source})
-                else:
-                    # Convert other types to dict
-                    sources.append({"source": str(source)})
-            
-            return answer, sources
+            return {"status_code": response.status_code, "text": response.text}
+
+    try:
+        # Recorded/replayed when CASSETTE_MODE is set; the key is the request payload
+        raw = await cassettes.through("perplexity", payload, lambda: resilience.call(
+            "perplexity", call, is_failure=lambda r: r["status_code"] >= 500 or r["status_code"] == 429
+        ))
+        status_code, response_text = raw["status_code"], raw["text"]
+        
+        # Get error details if request failed
+        if status_code != 200:
+            error_text = response_text
+            try:
+                error_json = json.loads(response_text)
+                error_msg = error_json.get("error", {}).get("message", error_text)
+                error_type = error_json.get("error", {}).get("type", "unknown")
+                return f"Perplexity API Error ({status_code}): {error_type} - {error_msg}", []
+            except:
+                return f"Perplexity API Error ({status_code}): {error_text[:200]}", []
+        
+        # Success - parse response
+        data = json.loads(response_text)
+        
+        # Extract answer
+        answer = data.get("choices", [{}])[0].get("message", {}).get("content", "No answer found.")
+        
+        # Extract sources/citations and normalize to dicts
+        raw_sources = []
+        
+        if "citations" in data:
+            raw_sources = data["citations"]
+        elif "sources" in data:
+            raw_sources = data["sources"]
+        elif "choices" in data and len(data["choices"]) > 0:
+            # Sometimes citations are in the choice
+            choice = data["choices"][0]
+            if "citations" in choice:
+                raw_sources = choice["citations"]
+        
+        # Normalize sources to dictionaries
+        sources = normalize_sources(raw_sources)
+        
+        return answer, sources
             
     except httpx.HTTPStatusError as e:
         error_msg = f"HTTP {e.response.status_code}: {e.response.text[:200]}"
@@ -228,6 +342,18 @@ async def perplexity_search(query: str) -> tuple[str, List[Dict[str, Any]]]:
         return f"Error: {str(e)}", []
 
 
+EVIDENCE_KEYWORDS = {
+    "recalls": ["recall", "recalled", "recalls"],
+    "lawsuits": ["lawsuit", "litigation", "sued"],
+    "warnings": ["warning", "advisory", "alert", "caution"],
+}
+
+def _overlap(a: str, b: str) -> float:
+    words_a, words_b = set(a.lower().split()), set(b.lower().split())
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
 def clean_evidence(detection_dict: Dict, search_results: List[tuple]) -> CleanedEvidence:
     """Clean and deduplicate evidence from search results"""
     evidence = detection_dict.get("evidence", {})
@@ -246,13 +372,13 @@ def clean_evidence(detection_dict: Dict, search_results: List[tuple]) -> Cleaned
         answer_lower = answer.lower()
         
         # Categorize findings
-        if any(kw in answer_lower for kw in ["recall", "recalled", "recalls"]):
+        if any(kw in answer_lower for kw in EVIDENCE_KEYWORDS["recalls"]):
             all_recalls.append({"description": answer[:500], "sources": sources})
         
-        if any(kw in answer_lower for kw in ["lawsuit", "litigation", "sued"]):
+        if any(kw in answer_lower for kw in EVIDENCE_KEYWORDS["lawsuits"]):
             all_lawsuits.append({"description": answer[:500], "sources": sources})
         
-        if any(kw in answer_lower for kw in ["warning", "advisory", "alert", "caution"]):
+        if any(kw in answer_lower for kw in EVIDENCE_KEYWORDS["warnings"]):
             all_warnings.append({"description": answer[:500], "sources": sources})
         
         if answer and answer not in all_findings:
@@ -263,13 +389,9 @@ def clean_evidence(detection_dict: Dict, search_results: List[tuple]) -> Cleaned
     for finding in all_findings:
         is_duplicate = False
         for existing in unique_findings:
-            words_finding = set(finding.lower().split())
-            words_existing = set(existing.lower().split())
-            if words_finding and words_existing:
-                overlap = len(words_finding & words_existing) / len(words_finding | words_existing)
-                if overlap > 0.8:
-                    is_duplicate = True
-                    break
+            if _overlap(finding, existing) > 0.8:
+                is_duplicate = True
+                break
         if not is_duplicate:
             unique_findings.append(finding)
     
@@ -280,17 +402,85 @@ def clean_evidence(detection_dict: Dict, search_results: List[tuple]) -> Cleaned
     
     return cleaned
 
-@deep_search_agent.on_message(model=DeepSearchRequest)
-async def handle_deep_search(ctx: Context, sender: str, msg: DeepSearchRequest):
-    ctx.logger.info(f"🔎 Deep Search Agent received request from {sender}")
-    
+class EvidenceAccumulator:
+    """How much new evidence each search answer adds, judged like clean_evidence keeps it.
+
+    Per answer: +1 for each recall/lawsuit/warning category not seen yet, +0.25 if the
+    finding survives the 0.8 Jaccard dedup, +0.5 x the share of its sources that are new.
+    With the default DEEP_SEARCH_MIN_GAIN of 0.5, an answer with no new category and
+    fewer than half new sources counts as low gain.
+    """
+
+    def __init__(self):
+        self.categories = set()
+        self.findings: List[str] = []
+        self.sources = set()
+
+    @staticmethod
+    def failed(answer: str) -> bool:
+        return not answer or answer.startswith(("Perplexity API Error", "Error:", "API key not found"))
+
+    def add(self, answer: str, source_ids: List[str]) -> Optional[float]:
+        """Marginal gain of one answer; None for failed searches (they say nothing about saturation)."""
+        if self.failed(answer):
+            return None
+        answer_lower = answer.lower()
+        new_categories = {c for c, kws in EVIDENCE_KEYWORDS.items() if any(kw in answer_lower for kw in kws)} - self.categories
+        gain = float(len(new_categories))
+        self.categories |= new_categories
+
+        finding = answer[:300]
+        if not any(_overlap(finding, f) > 0.8 for f in self.findings):
+            self.findings.append(finding)
+            gain += 0.25   # different queries almost always differ in wording
+
+        new_sources = set(source_ids) - self.sources
+        if source_ids:
+            gain += 0.5 * len(new_sources) / len(set(source_ids))
+        self.sources |= new_sources
+        return round(gain, 3)
+
+class SharedSearch:
+    """Perplexity results shared between several deep searches (e.g. one batch upload).
+
+    Queries with the same words (case and order ignored) run once; later callers
+    await the same task. A caller that times out or is cancelled leaves the search
+    running for the others. A failed search (perplexity_search reports errors as
+    answers, see EvidenceAccumulator.failed) is forgotten so the next caller retries.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(query: str) -> str:
+        return " ".join(sorted(set(query.lower().split())))
+
+    async def search(self, query: str) -> tuple[str, List[Dict[str, Any]]]:
+        key = self.key(query)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(perplexity_search(query))
+            task.add_done_callback(lambda t: self._forget_failed(key, t))
+        else:
+            SHARED_SEARCH_HITS.inc()
+        return await asyncio.shield(task)
+
+    def _forget_failed(self, key: str, task: asyncio.Task) -> None:
+        failed = task.cancelled() or task.exception() is not None or EvidenceAccumulator.failed(task.result()[0])
+        if failed and self._tasks.get(key) is task:
+            del self._tasks[key]
+
+async def run_deep_search(msg: DeepSearchRequest, logger=log, search=None) -> WriterRequest:
+    """Deep search stage: run the research queries and build the writer request.
+
+    `search` replaces perplexity_search, e.g. with SharedSearch.search for batches.
+    """
+    search = search or perplexity_search
     detection_dict = msg.detection_result
     product_name = detection_dict.get("product", {}).get("product_name", "Unknown")
-    ctx.logger.info(f"   Product: {product_name}")
-    
+    logger.info(f"   Product: {product_name}")
 
-    request_id = detection_dict.get("request_id")
-    callback_url = detection_dict.get("callback_url")
     # Get research queries
     queries = detection_dict.get("research_queries", [])
     
@@ -302,69 +492,136 @@ async def handle_deep_search(ctx: Context, sender: str, msg: DeepSearchRequest):
         if product.get("brand"):
             queries.append(f"{product['brand']} product safety concerns")
     
+    # Merge near-duplicates, cover recall/lawsuit/warning, best queries first
+    planned = plan_queries(queries, detection_dict.get("product", {}))
+    RESEARCH_QUERIES.labels(stage="proposed").inc(len(queries))
+    RESEARCH_QUERIES.labels(stage="planned").inc(len(planned))
+
     # Perform searches
-    ctx.logger.info(f"🔍 Performing {len(queries[:5])} searches...")
+    logger.info(f"🔍 Performing {len(planned)} searches (planned from {len(queries)} queries)...")
     search_results = []
     all_sources = []
     aggregated_answers = []
+    source_table = {}
+    accumulator = EvidenceAccumulator()
+    gains = []
+    stop_reason = "completed"
+    started = time.monotonic()
     
-    for query in queries[:5]:  # Limit to 5
-        ctx.logger.info(f"   Searching: {query}")
-        answer, sources = await perplexity_search(query)
-        search_results.append((answer, sources))
+    for i, query in enumerate(planned):
+        if time.monotonic() - started >= DEEP_SEARCH_TIME_BUDGET:
+            stop_reason = "time_budget"
+            break
+        logger.info(f"   Searching: {query}")
+        with timed("perplexity", msg.timings, key=f"perplexity_{i}", query=query):
+            answer, sources = await search(query)
+        # Sources travel as ids from here on; the URLs go to the shared source store once
+        source_ids = list(dict.fromkeys(
+            source_store.intern(source_table, s) for s in normalize_sources(sources)
+        ))
+        search_results.append((answer, source_ids))
         aggregated_answers.append(answer)
-        # Ensure all sources are dicts before extending
-        normalized_sources = []
-        for source in sources:
-            if isinstance(source, dict):
-                normalized_sources.append(source)
-            elif isinstance(source, str):
-                normalized_sources.append({"url": source, "title": source})
-            else:
-                normalized_sources.append({"source": str(source)})
-        all_sources.extend(normalized_sources)
+        all_sources.extend(sid for sid in source_ids if sid not in all_sources)
+
+        gain = accumulator.add(answer, source_ids)
+        gains.append(gain)
+        answered = sum(g is not None for g in gains)   # failed searches do not count
+        if gain is not None and answered >= DEEP_SEARCH_MIN_QUERIES \
+                and gain < DEEP_SEARCH_MIN_GAIN and i < len(planned) - 1:
+            stop_reason = "low_gain"
+            break
+    await source_store.store(source_table)
+
+    search_stats = {"planned": len(planned), "run": len(search_results), "stop_reason": stop_reason, "gains": gains}
+    DEEP_SEARCH_STOPS.labels(reason=stop_reason).inc()
+    logger.info(f"   Stopped after {len(search_results)}/{len(planned)} searches: {stop_reason}")
     
     # Clean evidence
-    cleaned_evidence = clean_evidence(detection_dict, search_results)
+    with timed("clean_evidence", msg.timings):
+        cleaned_evidence = clean_evidence(detection_dict, search_results)
     
     # Calculate confidence
     confidence = detection_dict.get("confidence", 0.0)
     if cleaned_evidence.recalls or cleaned_evidence.lawsuits or cleaned_evidence.warnings:
         confidence = min(1.0, confidence + 0.2)
     
+    logger.info(f"✅ Search completed!")
+    logger.info(f"   Recalls: {len(cleaned_evidence.recalls)}")
+    logger.info(f"   Lawsuits: {len(cleaned_evidence.lawsuits)}")
+    logger.info(f"   Warnings: {len(cleaned_evidence.warnings)}")
     
-    
-    # Create response
-    response = DeepSearchResponse(
+    return WriterRequest(
+        request_id=msg.request_id,
+        callback_url=msg.callback_url,
+        product_name=product_name,
         cleaned_evidence=cleaned_evidence,
         aggregated_answers=aggregated_answers,
         all_sources=all_sources,
         confidence=confidence,
-        
-    )
-    
-    ctx.logger.info(f"✅ Search completed!")
-    ctx.logger.info(f"   Recalls: {len(cleaned_evidence.recalls)}")
-    ctx.logger.info(f"   Lawsuits: {len(cleaned_evidence.lawsuits)}")
-    ctx.logger.info(f"   Warnings: {len(cleaned_evidence.warnings)}")
-    
-    
-    await ctx.send(
-        writer_agent.address,
-        WriterRequest(
-            request_id=msg.request_id,
-            callback_url=msg.callback_url,
-            product_name=product_name,
-            cleaned_evidence=cleaned_evidence,
-            aggregated_answers=aggregated_answers,
-            all_sources=all_sources,
-            confidence=confidence,
-        )
+        timings=msg.timings,
+        traceparent=current_traceparent() or msg.traceparent,
+        priority=msg.priority,
+        user_id=msg.user_id,
+        search_stats=search_stats,
     )
 
+async def compact_writer_request(msg: WriterRequest) -> WriterRequest:
+    """Replace the bulky evidence fields with a packed blob, or a checkpoint id when large."""
+    evidence = {
+        "cleaned_evidence": msg.cleaned_evidence.model_dump(),
+        "aggregated_answers": msg.aggregated_answers,
+        "all_sources": msg.all_sources,
+    }
+    blob = pack(evidence)
+    compact = msg.copy(update={
+        "cleaned_evidence": CleanedEvidence(),
+        "aggregated_answers": [],
+        "all_sources": [],
+    })
+    if len(blob) > INLINE_PAYLOAD_LIMIT:
+        compact.evidence_ref = await save_checkpoint(msg.request_id, "deep_search", evidence)
+    else:
+        compact.evidence_blob = blob
+    return compact
+
+async def expand_writer_request(msg: WriterRequest) -> WriterRequest:
+    """Inverse of compact_writer_request; inline requests are returned unchanged."""
+    if msg.evidence_ref:
+        evidence = await load_checkpoint(msg.evidence_ref)
+    elif msg.evidence_blob:
+        evidence = unpack(msg.evidence_blob)
+    else:
+        return msg
+    return msg.copy(update={
+        "cleaned_evidence": CleanedEvidence(**evidence["cleaned_evidence"]),
+        "aggregated_answers": evidence["aggregated_answers"],
+        "all_sources": evidence["all_sources"],
+        "evidence_blob": None,
+        "evidence_ref": None,
+    })
+
+@deep_search_agent.on_message(model=DeepSearchRequest)
+async def handle_deep_search(ctx: Context, sender: str, msg: DeepSearchRequest):
+    ctx.logger.info(f"🔎 Deep Search Agent received request from {sender}")
+    with span("deep_search_agent.handle", parent=msg.traceparent, request_id=msg.request_id), \
+            work_class(msg.priority, msg.user_id), agent_registry.track(deep_search_agent.address):
+        writer_request = await run_deep_search(msg, ctx.logger)
+        await send_balanced(ctx, "writer", DEEP_SEARCH_SEED, await compact_writer_request(writer_request),
+                            writer_agent.address)
+
 @deep_search_agent.on_event("startup")
 async def deep_search_startup(ctx: Context):
     ctx.logger.info(f"🔎 Deep Search Agent Address: {deep_search_agent.address}")
+    await agent_registry.register(deep_search_agent.address, "deep_search", BUREAU_ENDPOINT)
+
+@deep_search_agent.on_interval(period=agent_registry.REGISTRY_HEARTBEAT_SECONDS)
+async def deep_search_heartbeat(ctx: Context):
+    await agent_registry.heartbeat(deep_search_agent.address)
+
+@deep_search_agent.on_event("shutdown")
+async def deep_search_shutdown(ctx: Context):
+    # The launcher drained this instance before signalling it (agent_registry.drain)
+    await agent_registry.leave(deep_search_agent.address, ctx.logger)
 
 # ============================================================================
 # Writer Agent - Generates final report from formatted data
@@ -372,37 +629,96 @@ async def deep_search_startup(ctx: Context):
 
 writer_agent = Agent(
     name="writer_agent",
-    seed="writer agent seed",
+    seed=WRITER_SEED,
     port=8003,
     endpoint=["http://127.0.0.1:8003/submit"],
 )
 
-@writer_agent.on_message(model=WriterRequest)
-async def handle_writer(ctx: Context, sender: str, msg: WriterRequest):
-    ctx.logger.info(f"✍️  Writer Agent received report for {msg.product_name}")
-    payload = msg.model_dump()   # IMPORTANT (convert Model -> dict)
-    result = await write_summary(payload)
+# Transport, scheduling and bookkeeping fields of WriterRequest. They are not evidence, so they
+# stay out of the Groq prompt and out of its cassette key (a user_id there would make cassettes per-user)
+WRITER_PROMPT_EXCLUDE = {
+    "evidence_blob", "evidence_ref", "timings", "traceparent", "priority", "user_id", "search_stats",
+}
+
+async def run_writer(msg: WriterRequest, logger=log) -> Dict[str, Any]:
+    """Writer stage: generate the final report JSON from the cleaned evidence."""
+    logger.info(f"✍️  Writer Agent received report for {msg.product_name}")
+    payload = msg.dict(exclude=WRITER_PROMPT_EXCLUDE)   # IMPORTANT (convert Model -> dict)
+    # Each URL appears once in the prompt; the evidence refers to it by id
+    table = await source_store.resolve(msg.all_sources)
+    payload["all_sources"] = {sid: table[sid]["url"] for sid in msg.all_sources if sid in table}
+    with timed("groq_writer", msg.timings):
+        result = await write_summary(payload)
     cleaned = clean_json_response(result)
     final_report = json.loads(cleaned)
+    final_report = await source_store.dehydrate_report(final_report, known=msg.all_sources)
 
-    ctx.logger.info(f"✅ Final report generated")
-    
-    
-    response = WriterResponse(
-        final_report=final_report,
-        status="success"
-    )
-    ctx.logger.info(f"🔍 Final report: {final_report}")
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        await client.post(
-            msg.callback_url,
-            json={"final_report": final_report}
+    logger.info(f"✅ Final report generated")
+    logger.info(f"🔍 Final report: {final_report}")
+    return final_report
+
+@writer_agent.on_message(model=WriterRequest)
+async def handle_writer(ctx: Context, sender: str, msg: WriterRequest):
+    with span("writer_agent.handle", parent=msg.traceparent, request_id=msg.request_id), \
+            work_class(msg.priority, msg.user_id), agent_registry.track(writer_agent.address):
+        msg = await expand_writer_request(msg)
+        final_report = await run_writer(msg, ctx.logger)
+        # The webhook is the only completion path: stored in the outbox first, retried until acknowledged
+        entry = await outbox.enqueue(
+            msg.request_id, msg.callback_url,
+            {"final_report": final_report, "timings": msg.timings, "search_stats": msg.search_stats},
+            current_traceparent(),
         )
-    await ctx.send(sender, response)
-    ctx.logger.info(f"✅ Report sent to webhook for request_id={msg.request_id}")
+        with timed("webhook", url=msg.callback_url):
+            delivered = await outbox.deliver(entry)
+    if delivered:
+        ctx.logger.info(f"✅ Report sent to webhook for request_id={msg.request_id}")
+    else:
+        ctx.logger.info(f"⏳ Webhook for request_id={msg.request_id} queued for retry")
+
+@writer_agent.on_interval(period=outbox.OUTBOX_POLL_SECONDS)
+async def retry_webhooks(ctx: Context):
+    retried = await outbox.deliver_due()
+    if retried:
+        ctx.logger.info(f"Retried {retried} webhook deliveries")
+
 @writer_agent.on_event("startup")
 async def writer_startup(ctx: Context):
     ctx.logger.info(f"✍️  Writer Agent Address: {writer_agent.address}")
+    await agent_registry.register(writer_agent.address, "writer", BUREAU_ENDPOINT)
+
+@writer_agent.on_interval(period=agent_registry.REGISTRY_HEARTBEAT_SECONDS)
+async def writer_heartbeat(ctx: Context):
+    await agent_registry.heartbeat(writer_agent.address)
+
+@writer_agent.on_event("shutdown")
+async def writer_shutdown(ctx: Context):
+    # The launcher drained this instance before signalling it (agent_registry.drain)
+    await agent_registry.leave(writer_agent.address, ctx.logger)
+
+# ============================================================================
+# In-process runner - same stages as the agents, without the Bureau hops
+# ============================================================================
+
+async def run_pipeline(msg: DetectionInput, logger=log,
+                       timings: Optional[Dict[str, float]] = None, search=None,
+                       search_stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run detect -> deep search -> writer as direct coroutines and return the final report.
+
+    Used by the API when PIPELINE_MODE=inprocess, i.e. when the API and the agents
+    share one host and there is nothing to gain from the envelope/webhook round trips.
+    Stage timings are added to `timings` and the deep search stats to `search_stats` when given.
+    """
+    with span("pipeline.inprocess", parent=msg.traceparent, request_id=msg.request_id), \
+            work_class(msg.priority, msg.user_id):
+        deep_search_request = run_detection(msg, logger)
+        writer_request = await run_deep_search(deep_search_request, logger, search)
+        final_report = await run_writer(writer_request, logger)
+    if timings is not None:
+        timings.update(writer_request.timings)
+    if search_stats is not None:
+        search_stats.update(writer_request.search_stats)
+    return final_report
 
 # advisor_agent = Agent(
 #     name="advisor_agent",
@@ -447,13 +763,15 @@ async def writer_startup(ctx: Context):
 # ============================================================================
 
 family = Bureau(
-    port=8000,
-    endpoint="http://127.0.0.1:8000/submit"
+    port=BUREAU_PORT,
+    endpoint=BUREAU_ENDPOINT
 )
 
-family.add(detect_agent)
-family.add(deep_search_agent)
-family.add(writer_agent)
+ROLE_AGENTS = {"detect": detect_agent, "deep_search": deep_search_agent, "writer": writer_agent}
+for _role, _agent in ROLE_AGENTS.items():
+    if AGENT_ROLE in ("all", _role):
+        family.add(_agent)
+        LOCAL_ADDRESSES.add(_agent.address)
 # family.add(test_agent)
 
 # ============================================================================
@@ -461,4 +779,6 @@ family.add(writer_agent)
 # ============================================================================
 
 if __name__ == "__main__":
+    from prometheus_client import start_http_server
+    start_http_server(int(os.getenv("BUREAU_METRICS_PORT", "9100")))
     family.run()
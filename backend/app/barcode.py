@@ -0,0 +1,100 @@
+"""
+Local barcode fast path for detection.
+
+decode_upc() reads a UPC/EAN from the photo on the CPU. If that code is in our
+product catalog (filled from earlier Gemini detections), detect_ingredients
+builds the detection from the catalog entry and skips the vision call.
+
+pip install pyzbar   (+ the zbar system library, e.g. apt install libzbar0)
+Without it the fast path is disabled and every image goes to Gemini.
+"""
+import asyncio
+import io
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from .db import client
+from .metrics import timed
+
+try:
+    from pyzbar import pyzbar
+except ImportError:  # also raised when the zbar shared library is missing
+    pyzbar = None
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "2048"))
+DECODE_MAX_SIDE = 1600
+RETAIL_SYMBOLOGIES = {"EAN13", "UPCA", "EAN8", "UPCE"}
+
+catalog = client[DB_NAME]["product_catalog"]
+
+try:
+    catalog.create_index("upc", unique=True)
+except Exception as e:
+    print("Failed to create product_catalog index:", e)
+
+# upc -> catalog entry, in front of Mongo
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def normalize_upc(code: str) -> str:
+    """EAN-13 with a leading 0 is a UPC-A; store that as the 12-digit form."""
+    code = "".join(ch for ch in code if ch.isdigit())
+    if len(code) == 13 and code.startswith("0"):
+        code = code[1:]
+    return code
+
+
+def decode_upc(image_bytes: bytes) -> Optional[str]:
+    """Return the first retail barcode in the image, or None. CPU-bound; call via a thread."""
+    if pyzbar is None:
+        return None
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("L", (DECODE_MAX_SIDE, DECODE_MAX_SIDE))  # cheap JPEG downscale while decoding
+    img = img.convert("L")
+    img.thumbnail((DECODE_MAX_SIDE, DECODE_MAX_SIDE))
+    for symbol in pyzbar.decode(img):
+        if symbol.type in RETAIL_SYMBOLOGIES:
+            return normalize_upc(symbol.data.decode("ascii", "ignore"))
+    return None
+
+
+def _cache_put(upc: str, entry: Dict[str, Any]) -> None:
+    _cache[upc] = entry
+    _cache.move_to_end(upc)
+    while len(_cache) > CATALOG_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def lookup(upc: str) -> Optional[Dict[str, Any]]:
+    entry = _cache.get(upc)
+    if entry is not None:
+        _cache.move_to_end(upc)
+        return entry
+    with timed("mongo_catalog_lookup"):
+        entry = await asyncio.to_thread(catalog.find_one, {"upc": upc}, {"_id": 0})
+    if entry:
+        _cache_put(upc, entry)
+    return entry
+
+
+async def remember(upc: str, detection: Dict[str, Any]) -> None:
+    """Store a Gemini detection under its UPC so the next scan can skip the vision call."""
+    product = detection.get("product") or {}
+    if not upc or not product.get("product_name"):
+        return
+    entry = {
+        "upc": upc,
+        "product": product,
+        "research_queries": detection.get("research_queries", []),
+        "evidence": detection.get("evidence", {}),
+        "confidence": detection.get("confidence", 0.0),
+        "updated_at": datetime.utcnow(),
+    }
+    with timed("mongo_catalog_upsert"):
+        await asyncio.to_thread(catalog.update_one, {"upc": upc}, {"$set": entry}, upsert=True)
+    _cache_put(upc, entry)
@@ -0,0 +1,147 @@
+"""
+Off-peak cache warming for popular products.
+
+During WARM_HOURS (UTC) the API process finds the most-scanned canonical
+(brand, product_name) pairs of the last WARM_LOOKBACK_DAYS, and re-runs deep
+search + writer (agents.run_pipeline, i.e. the deep_search_agent / writer_agent
+logic) for those whose report_cache entry is older than WARM_REFRESH_HOURS.
+Upstream calls are scheduled as "warm" work, behind interactive and batch calls.
+
+Each run is capped at WARM_MAX_PRODUCTS pipelines and WARM_MAX_SECONDS. Every
+API worker runs the loop, but a run first takes the cache_warm_lease document,
+so only one worker warms at a time and the caps hold for the whole deployment.
+"""
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from pymongo.errors import DuplicateKeyError
+
+from . import report_cache
+from .db import client
+from .agents import DetectionInput, run_pipeline
+from .metrics import timed, CACHE_WARM_RUNS
+from .scheduler import work_class
+
+WARM_HOURS = os.getenv("WARM_HOURS", "2-6")   # UTC, start-end (end exclusive); empty disables
+WARM_INTERVAL_SECONDS = float(os.getenv("WARM_INTERVAL_SECONDS", "900"))
+WARM_LOOKBACK_DAYS = float(os.getenv("WARM_LOOKBACK_DAYS", "7"))
+WARM_TOP_N = int(os.getenv("WARM_TOP_N", "20"))
+WARM_MIN_SCANS = int(os.getenv("WARM_MIN_SCANS", "3"))
+WARM_REFRESH_HOURS = float(os.getenv("WARM_REFRESH_HOURS", "72"))
+WARM_MAX_PRODUCTS = int(os.getenv("WARM_MAX_PRODUCTS", "10"))
+WARM_MAX_SECONDS = float(os.getenv("WARM_MAX_SECONDS", "900"))
+
+leases = client[os.environ.get("MONGO_DB", "cruzhack")]["cache_warm_lease"]
+_holder = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def in_window(now: datetime) -> bool:
+    if not WARM_HOURS:
+        return False
+    start, _, end = WARM_HOURS.partition("-")
+    start, end = int(start), int(end or 24)
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end   # window wraps midnight
+
+
+def popular_products(coll, limit: int = WARM_TOP_N) -> List[Dict[str, Any]]:
+    since = datetime.utcnow() - timedelta(days=WARM_LOOKBACK_DAYS)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}, "canonical.product_name": {"$ne": None}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"brand": "$canonical.brand", "product_name": "$canonical.product_name"},
+            "scans": {"$sum": 1},
+            "detection": {"$first": "$detection"},   # most recent detection of the product
+        }},
+        {"$match": {"scans": {"$gte": WARM_MIN_SCANS}, "detection": {"$ne": None}}},
+        {"$sort": {"scans": -1}},
+        {"$limit": limit},
+    ]
+    return list(coll.aggregate(pipeline, allowDiskUse=True))
+
+
+def take_lease() -> bool:
+    """Take the deployment-wide warming lease, unless another worker holds an unexpired one."""
+    now = datetime.utcnow()
+    try:
+        leases.find_one_and_update(
+            {"_id": "warm", "$or": [{"expires_at": {"$lt": now}}, {"holder": _holder}]},
+            # Outlives a run capped at WARM_MAX_SECONDS, in case release_lease never runs
+            {"$set": {"holder": _holder, "expires_at": now + timedelta(seconds=WARM_MAX_SECONDS + 60)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False   # held elsewhere: the upsert's insert collided with the existing lease
+
+
+def release_lease() -> None:
+    leases.update_one({"_id": "warm", "holder": _holder}, {"$set": {"expires_at": datetime.utcnow()}})
+
+
+async def warm_once(coll) -> Dict[str, int]:
+    """One budget-capped warming pass. Returns counts by outcome."""
+    counts = {"warmed": 0, "fresh": 0, "failed": 0}
+    deadline = asyncio.get_running_loop().time() + WARM_MAX_SECONDS
+    with timed("cache_warm_aggregate"):
+        products = await asyncio.to_thread(popular_products, coll)
+
+    for product in products:
+        if counts["warmed"] + counts["failed"] >= WARM_MAX_PRODUCTS:
+            break
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            break
+        canonical = {"brand": product["_id"].get("brand"), "product_name": product["_id"]["product_name"]}
+        age = await report_cache.age(canonical)
+        if age is not None and age < timedelta(hours=WARM_REFRESH_HOURS):
+            counts["fresh"] += 1
+            continue
+
+        message = DetectionInput(
+            detection_result=product["detection"],
+            request_id=f"warm-{uuid.uuid4().hex}",
+            callback_url="",
+            priority="warm",
+        )
+        search_stats: Dict[str, Any] = {}
+        try:
+            with work_class("warm"):
+                final_report = await asyncio.wait_for(
+                    run_pipeline(message, search_stats=search_stats), timeout=remaining
+                )
+            await report_cache.store(canonical, final_report, "warm", search_stats)
+            counts["warmed"] += 1
+        except Exception as e:
+            print(f"Cache warming failed for {canonical}: {e}")
+            counts["failed"] += 1
+
+    for outcome, n in counts.items():
+        CACHE_WARM_RUNS.labels(outcome=outcome).inc(n)
+    return counts
+
+
+async def run_forever(coll) -> None:
+    if not WARM_HOURS:
+        return
+    while True:
+        await asyncio.sleep(WARM_INTERVAL_SECONDS)
+        if not in_window(datetime.utcnow()):
+            continue
+        try:
+            if not await asyncio.to_thread(take_lease):
+                continue
+            try:
+                counts = await warm_once(coll)
+            finally:
+                await asyncio.to_thread(release_lease)
+            if counts["warmed"] or counts["failed"]:
+                print(f"Cache warming: {counts}")
+        except Exception as e:
+            print("Cache warming run failed:", e)
@@ -0,0 +1,77 @@
+"""
+Record-and-replay cassettes for the Gemini, Perplexity and Groq calls.
+
+    CASSETTE_MODE=off       (default) call upstreams normally
+    CASSETTE_MODE=record    call upstreams and save each request/response pair
+    CASSETTE_MODE=replay    serve saved responses, never call upstreams
+    CASSETTE_DIR=cassettes  one JSON file per pair: <dir>/<upstream>/<key>.json
+    CASSETTE_LATENCY_SCALE=1.0   replay sleeps recorded latency x scale (0 = instant)
+
+Cassettes are keyed by a normalized request: the caller passes only the fields
+that decide the response (no API keys, request ids or callback URLs), and the
+key is a hash of their canonical JSON.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes")
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+
+
+class CassetteMiss(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def _path(upstream: str, key: str) -> str:
+    return os.path.join(CASSETTE_DIR, upstream, f"{key}.json")
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def _save(path: str, record: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+async def through(upstream: str, request: Dict[str, Any], call: Callable[[], Awaitable[Any]]) -> Any:
+    """Run `call` (which must return JSON-able data) through the cassette layer."""
+    if CASSETTE_MODE == "off":
+        return await call()
+
+    path = _path(upstream, request_key(request))
+
+    if CASSETTE_MODE == "replay":
+        if not os.path.exists(path):
+            raise CassetteMiss(f"No {upstream} cassette for request {os.path.basename(path)}")
+        record = await asyncio.to_thread(_load, path)
+        if CASSETTE_LATENCY_SCALE > 0:
+            await asyncio.sleep(record["latency"] * CASSETTE_LATENCY_SCALE)
+        return record["response"]
+
+    start = time.perf_counter()
+    response = await call()
+    record = {
+        "upstream": upstream,
+        "request": request,
+        "response": response,
+        "latency": round(time.perf_counter() - start, 4),
+        "recorded_at": time.time(),
+    }
+    await asyncio.to_thread(_save, path, record)
+    return response
@@ -0,0 +1,136 @@
+"""
+In-memory fuzzy index of brands, products and categories seen in detections.
+
+Gemini returns brand / product / category as free text ("MONSTER", "Monster",
+"Energy Drink", "energy drinks"...). The index maps each to one canonical
+spelling so reports can be grouped, cached and counted per product.
+
+- strings are normalized once with rapidfuzz's default_process and kept alongside
+  the canonical form, so matching never re-processes the choices
+- batches are scored in one rapidfuzz.process.cdist call
+- new values are added as reports complete; the full index is rebuilt from
+  Mongo at startup
+"""
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from .DetectService import CANON_PRODUCT_TYPES
+
+BRAND_THRESHOLD = int(os.getenv("CATALOG_BRAND_THRESHOLD", "90"))
+PRODUCT_THRESHOLD = int(os.getenv("CATALOG_PRODUCT_THRESHOLD", "92"))
+CATEGORY_THRESHOLD = int(os.getenv("CATALOG_CATEGORY_THRESHOLD", "85"))
+
+
+def normalize(text: Optional[str]) -> str:
+    return " ".join(default_process(text or "").split())
+
+
+class FuzzyIndex:
+    """Canonical strings plus their processed form, matched with cdist."""
+
+    def __init__(self, scorer, threshold: int, frozen: bool = False):
+        self.scorer = scorer
+        self.threshold = threshold
+        self.frozen = frozen          # frozen indexes only match, never grow
+        self.canonical: List[str] = []
+        self.processed: List[str] = []
+        self._exact: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _append(self, value: str, processed: str) -> str:
+        # match_many reads without the lock from other threads: append to the lists
+        # first and publish in _exact last, so every index it can see is valid
+        with self._lock:
+            if processed not in self._exact:
+                self.canonical.append(value)
+                self.processed.append(processed)
+                self._exact[processed] = len(self.canonical) - 1
+            return self.canonical[self._exact[processed]]
+
+    def match_many(self, values: Iterable[Optional[str]]) -> List[Optional[str]]:
+        queries = [normalize(v) for v in values]
+        results: List[Optional[str]] = [None] * len(queries)
+        pending = []
+        for i, q in enumerate(queries):
+            if q in self._exact:
+                results[i] = self.canonical[self._exact[q]]
+            elif q:
+                pending.append(i)
+        if pending and self.processed:
+            choices = list(self.processed)
+            scores = process.cdist(
+                [queries[i] for i in pending], choices,
+                scorer=self.scorer, processor=None, score_cutoff=self.threshold, workers=-1,
+            )
+            for row, i in enumerate(pending):
+                best = int(scores[row].argmax())
+                if scores[row][best] >= self.threshold:
+                    results[i] = self.canonical[best]
+        return results
+
+    def add_many(self, values: Iterable[Optional[str]]) -> List[Optional[str]]:
+        """Canonical form of each value, adding the ones that match nothing."""
+        values = list(values)
+        matched = self.match_many(values)
+        if self.frozen:
+            return matched
+        for i, (value, hit) in enumerate(zip(values, matched)):
+            if hit is None and normalize(value):
+                # Re-check: an earlier value in this batch may have just been added
+                matched[i] = self.match_many([value])[0] or self._append(value.strip(), normalize(value))
+        return matched
+
+
+class ProductIndex:
+    def __init__(self):
+        self.brands = FuzzyIndex(fuzz.WRatio, BRAND_THRESHOLD)
+        self.products = FuzzyIndex(fuzz.token_sort_ratio, PRODUCT_THRESHOLD)
+        self.categories = FuzzyIndex(fuzz.WRatio, CATEGORY_THRESHOLD, frozen=True)
+        for c in CANON_PRODUCT_TYPES:
+            self.categories._append(c, normalize(c.replace("_", " ")))
+
+    def _canonicalize(self, detections: List[Dict[str, Any]], grow: bool) -> List[Dict[str, Optional[str]]]:
+        products = [(d.get("product") or {}) for d in detections]
+        op = "add_many" if grow else "match_many"
+        brands = getattr(self.brands, op)(p.get("brand") for p in products)
+        names = getattr(self.products, op)(p.get("product_name") for p in products)
+        categories = self.categories.match_many(p.get("category") for p in products)
+        return [
+            {"brand": b, "product_name": n, "category": c}
+            for b, n, c in zip(brands, names, categories)
+        ]
+
+    def add(self, detection: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """Canonicalize, adding unseen brand/product spellings to the index. CPU-bound; call via a thread."""
+        return self._canonicalize([detection], grow=True)[0]
+
+    def build(self, coll, batch_size: int = 1000) -> int:
+        """(Re)build from every distinct brand/product/category in the reports collection."""
+        pipeline = [
+            {"$match": {"detection.product": {"$exists": True}}},
+            {"$group": {"_id": {
+                "brand": "$detection.product.brand",
+                "product_name": "$detection.product.product_name",
+                "category": "$detection.product.category",
+            }}},
+        ]
+        fresh = ProductIndex()
+        batch, seen = [], 0
+        for row in coll.aggregate(pipeline, allowDiskUse=True):
+            batch.append({"product": row["_id"]})
+            if len(batch) >= batch_size:
+                fresh._canonicalize(batch, grow=True)
+                seen += len(batch)
+                batch = []
+        if batch:
+            fresh._canonicalize(batch, grow=True)
+            seen += len(batch)
+        self.brands, self.products = fresh.brands, fresh.products
+        return seen
+
+
+product_index = ProductIndex()
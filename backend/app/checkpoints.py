@@ -0,0 +1,44 @@
+"""
+Stage checkpoints - large intermediate results stored in Mongo so agent messages
+can carry an id instead of the full payload.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any
+
+from bson import ObjectId
+
+from .codec import pack, unpack
+from .db import client
+from .metrics import timed
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", "86400"))
+
+checkpoints = client[DB_NAME]["stage_checkpoints"]
+
+try:
+    checkpoints.create_index("created_at", expireAfterSeconds=CHECKPOINT_TTL_SECONDS)
+except Exception as e:
+    print("Failed to create stage_checkpoints TTL index:", e)
+
+
+async def save_checkpoint(request_id: str, stage: str, data: Any) -> str:
+    doc = {
+        "request_id": request_id,
+        "stage": stage,
+        "payload": pack(data),
+        "created_at": datetime.utcnow(),
+    }
+    with timed("mongo_checkpoint_save"):
+        result = await asyncio.to_thread(checkpoints.insert_one, doc)
+    return str(result.inserted_id)
+
+
+async def load_checkpoint(checkpoint_id: str) -> Any:
+    with timed("mongo_checkpoint_load"):
+        doc = await asyncio.to_thread(checkpoints.find_one, {"_id": ObjectId(checkpoint_id)})
+    if not doc:
+        raise KeyError(f"stage checkpoint {checkpoint_id} not found")
+    return unpack(doc["payload"])
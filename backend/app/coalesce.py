@@ -0,0 +1,36 @@
+"""
+Request coalescing - concurrent callers with the same key share one run.
+
+Used by /report-json so a retry or double-tap on the same image attaches to
+the pipeline that is already in flight instead of starting another one.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from .metrics import COALESCED_REQUESTS
+
+
+class Coalescer:
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            COALESCED_REQUESTS.inc()
+        # shield: one caller disconnecting must not cancel the run for the others
+        return await asyncio.shield(task)
+
+
+report_runs = Coalescer()
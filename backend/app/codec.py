@@ -0,0 +1,105 @@
+"""
+Compact encoding for agent messages and the envelope we submit to the Bureau.
+
+pack()/unpack() turn a JSON-able value into a tagged base64 string, e.g.
+"msgpack+zstd:<b64>". The tag travels with the data, so a receiver always knows
+how to decode it; the sender picks the best format it has installed.
+
+pip install msgpack zstandard   (optional - falls back to json + zlib)
+"""
+import base64
+import json
+import uuid
+import zlib
+from functools import lru_cache
+from typing import Any, Optional, Type
+
+from uagents_core.envelope import Envelope
+from uagents_core.identity import Identity
+from uagents_core.models import Model as UA_Model
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def preferred_encoding() -> str:
+    body = "msgpack" if msgpack else "json"
+    comp = "zstd" if zstandard else "zlib"
+    return f"{body}+{comp}"
+
+
+def pack(obj: Any, encoding: Optional[str] = None) -> str:
+    """Encode obj as '<body>+<compression>:<base64>'."""
+    encoding = encoding or preferred_encoding()
+    body_fmt, comp = encoding.split("+")
+
+    if body_fmt == "msgpack":
+        raw = msgpack.packb(obj, use_bin_type=True)
+    else:
+        raw = json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    if comp == "zstd":
+        raw = zstandard.ZstdCompressor(level=3).compress(raw)
+    elif comp == "zlib":
+        raw = zlib.compress(raw, 6)
+
+    return f"{encoding}:{base64.b64encode(raw).decode()}"
+
+
+def unpack(data: str) -> Any:
+    """Decode a string produced by pack()."""
+    encoding, _, b64 = data.partition(":")
+    body_fmt, comp = encoding.split("+")
+    raw = base64.b64decode(b64)
+
+    if comp == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to decode this payload")
+        raw = zstandard.ZstdDecompressor().decompress(raw)
+    elif comp == "zlib":
+        raw = zlib.decompress(raw)
+
+    if body_fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack is required to decode this payload")
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw)
+
+
+@lru_cache(maxsize=None)
+def schema_digest(model: Type[UA_Model]) -> str:
+    """Schema digest for a uAgents model, computed once per model class."""
+    try:
+        return UA_Model.build_schema_digest(model)
+    except Exception:
+        return f"{model.__name__.lower()}-v1"
+
+
+def build_envelope(message: UA_Model, target: str, identity: Optional[Identity] = None) -> dict:
+    """Build a (signed) envelope dict ready to POST to an agent's /submit endpoint.
+
+    The envelope payload itself stays base64 JSON - that is what uAgents decodes on
+    the receiving side. Bulky fields are compacted at the message level instead.
+    """
+    payload_json = json.dumps(message.model_dump(), separators=(",", ":"), ensure_ascii=False)
+    env = Envelope(
+        version=1,
+        sender=identity.address if identity else "fastapi",
+        target=target,
+        session=uuid.uuid4(),
+        schema_digest=schema_digest(type(message)),
+        payload=base64.b64encode(payload_json.encode()).decode(),
+    )
+    if identity:
+        env.sign(identity)
+    envelope = env.model_dump()
+    if envelope.get("session") is not None:
+        envelope["session"] = str(envelope["session"])
+    return envelope
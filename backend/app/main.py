@@ -1,31 +1,40 @@
-import asyncio, uuid, os, json, base64
+import asyncio, uuid, os, json
 import httpx
 from pydantic import BaseModel
-from uagents_core.envelope import Envelope
 from uagents_core.identity import Identity
-from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from .DetectService import read_image_bytes, detect_ingredients
 from .json_to_pdf import json_to_pdf
 from .db import client
 from datetime import datetime
-from uagents_core.models import Model as UA_Model
-from .agents import DetectionInput, detect_agent
+from .codec import build_envelope
+from .admission import admission
+from .coalesce import report_runs
+from .catalog_index import product_index
+from .metrics import timed
+from . import uploads, retention, sources, report_cache, cache_warmer, thumbnails
+from .tracing import span, annotate, current_traceparent
+from .scheduler import work_class, current_work_class
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .agents import DetectionInput, SharedSearch, detect_agent, run_pipeline
 import boto3
-from io import BytesIO
 
 # AWS Config
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL")  # S3-compatible stand-in (load tests, MinIO)
 
 s3_client = boto3.client(
     "s3",
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
+    region_name=AWS_REGION,
+    endpoint_url=AWS_ENDPOINT_URL,
 )
 
 # FastAPI
@@ -53,56 +62,144 @@ except Exception:
 PENDING: dict[str, asyncio.Future] = {}
 DETECT_AGENT_SUBMIT = os.getenv("DETECT_AGENT_SUBMIT", "http://127.0.0.1:8000/submit")
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://127.0.0.1:8080")
+# "bureau": submit to the uAgents Bureau and wait for the writer webhook (default)
+# "inprocess": run the agent stages as coroutines inside the API process
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "bureau")
+PIPELINE_TIMEOUT = float(os.getenv("PIPELINE_TIMEOUT", "90"))
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "50"))
+BATCH_DETECT_CONCURRENCY = int(os.getenv("BATCH_DETECT_CONCURRENCY", "4"))
+BATCH_PIPELINE_CONCURRENCY = int(os.getenv("BATCH_PIPELINE_CONCURRENCY", "4"))
 DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
 COLL_NAME = os.environ.get("MONGO_COLLECTION", "reports")
 coll = client[DB_NAME][COLL_NAME]
+delete_jobs = client[DB_NAME]["delete_jobs"]
+DELETE_BATCH_SIZE = 500  # two S3 keys (original + thumbnail) per report; delete_objects takes 1000
+
+@app.on_event("startup")
+async def start_retention():
+    # Kept on app.state so the task is not garbage-collected
+    app.state.retention_task = asyncio.create_task(retention.run_forever(coll))
+
+@app.on_event("startup")
+async def start_cache_warmer():
+    app.state.cache_warm_task = asyncio.create_task(cache_warmer.run_forever(coll))
+
+@app.on_event("startup")
+async def start_thumbnail_backfill():
+    app.state.thumbnail_backfill_task = asyncio.create_task(
+        thumbnails.run_backfill(coll, s3_client, AWS_S3_BUCKET, _s3_key)
+    )
+
+@app.on_event("shutdown")
+async def stop_thumbnail_pool():
+    thumbnails.shutdown()
+
+@app.on_event("startup")
+async def build_product_index():
+    try:
+        count = await asyncio.to_thread(product_index.build, coll)
+        print(f"Product index built from {count} distinct detections")
+    except Exception as e:
+        print("Failed to build product index:", e)
+
+def current_user() -> dict:
+    # Placeholder identity until the frontend sends Auth0 tokens (see auth.verify_jwt)
+    return {"sub": "test_user"}
+
+def rate_limited_user(user: dict = Depends(current_user)) -> dict:
+    admission.check_rate(user.get("sub"))
+    return user
 
 # Webhook endpoint
 @app.post("/report/webhook/{request_id}")
 async def report_webhook(request_id: str, request: Request):
-    payload = await request.json()
-    fut = PENDING.get(request_id)
-    if fut and not fut.done():
-        fut.set_result(payload)
+    with span("report_webhook", parent=request.headers.get("traceparent"), request_id=request_id):
+        payload = await request.json()
+        final_report = payload.get("final_report")
+        if not isinstance(final_report, dict):
+            raise HTTPException(400, "Webhook payload has no final_report")
 
-    final_report = payload.get("final_report")
-    if final_report:
-        await asyncio.to_thread(
-            coll.update_one,
-            {"request_id": request_id},
-            {"$set": {"final_report": final_report, "status": "complete", "completed_at": datetime.utcnow()}}
+        # The single completion write; redelivered webhooks (writer outbox retries) find it done
+        applied = await _complete_report(
+            request_id, final_report, payload.get("timings") or {}, payload.get("search_stats")
         )
-    return {"ok": True}
 
-# POST image -> generate report
-@app.post("/report-json")
-async def report_json(image: UploadFile = File(...), user=Depends(lambda: {"sub": "test_user"})):
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(400, "Upload must be an image")
+        fut = PENDING.get(request_id)
+        if fut and not fut.done():
+            fut.set_result(payload)
+    return {"ok": True, "duplicate": not applied}
 
-    img_bytes = await image.read()
-    await image.close()
+async def _submit_to_bureau(message: DetectionInput, request_id: str) -> dict:
+    """Send the detection to detect_agent through the Bureau and wait for the writer webhook."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    PENDING[request_id] = fut
 
-    # Upload to S3 without ACL (avoid bucket errors)
-    s3_key = f"images/{uuid.uuid4().hex}.{image.filename.split('.')[-1]}"
-    await asyncio.to_thread(
-        s3_client.upload_fileobj,
-        BytesIO(img_bytes),
-        AWS_S3_BUCKET,
-        s3_key,
-        ExtraArgs={"ContentType": image.content_type}
-    )
+    envelope = build_envelope(message, detect_agent.address, _CLIENT_IDENTITY)
+
+    # Metrics only: the message (and its timings) is already sealed in the envelope
+    with timed("envelope_submit"):
+        async with httpx.AsyncClient(timeout=30.0) as client_http:
+            r = await client_http.post(DETECT_AGENT_SUBMIT, json=envelope)
+    if r.status_code >= 300:
+        PENDING.pop(request_id, None)
+        raise HTTPException(500, f"detect_agent submit failed: {r.status_code} {r.text[:200]}")
 
+    try:
+        return await asyncio.wait_for(fut, timeout=PIPELINE_TIMEOUT)
+    except asyncio.TimeoutError:
+        # The webhook may have landed on another API worker
+        doc = await asyncio.to_thread(
+            coll.find_one, {"request_id": request_id, "status": "complete"}, {"final_report": 1}
+        )
+        if doc:
+            return {"final_report": doc["final_report"]}
+        raise HTTPException(504, "Timed out waiting for writer webhook")
+    finally:
+        PENDING.pop(request_id, None)
+
+def _s3_key(doc: dict) -> str | None:
+    """S3 key of a report's image; documents from before s3_key was stored fall back to the URL."""
+    if doc.get("s3_key"):
+        return doc["s3_key"]
+    image_url = doc.get("image_url")
+    if not image_url:
+        return None
+    return image_url.split(_s3_url(""))[-1]
+
+def _s3_url(s3_key: str) -> str:
     # Proper URL to avoid 301 redirect
     if AWS_REGION == "us-east-1":
-        s3_url = f"https://{AWS_S3_BUCKET}.s3.amazonaws.com/{s3_key}"
-    else:
-        s3_url = f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+        return f"https://{AWS_S3_BUCKET}.s3.amazonaws.com/{s3_key}"
+    return f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+
+async def _ingest_image(img_bytes: bytes, s3_key: str, user: dict,
+                        timings: dict) -> tuple[DetectionInput, str, dict]:
+    """Run detection on an image already stored at s3_key and insert the pending report.
+
+    img_bytes is the (downscaled) copy for detection. Returns the agent message,
+    the image URL and the canonical (brand, product, category).
+    """
+    s3_url = _s3_url(s3_key)
 
-    detection = detect_ingredients(img_bytes)
+    # Rendered in the thumbnail process pool while the vision model runs
+    thumbnail_task = asyncio.ensure_future(thumbnails.create(s3_client, AWS_S3_BUCKET, s3_key, img_bytes))
+    try:
+        with timed("gemini_detect", timings):
+            detection = await detect_ingredients(img_bytes)
+    except BaseException:
+        thumbnail_task.cancel()
+        raise
+    thumbnail_key = await thumbnail_task
     original_detection = detection.model_dump() if hasattr(detection, "model_dump") else detection
 
+    # Canonical brand/product/category for grouping and caching; new spellings join the index here.
+    # The fuzzy match (rapidfuzz cdist) is CPU-bound, so it stays off the event loop.
+    with timed("canonicalize", timings):
+        canonical = await asyncio.to_thread(product_index.add, original_detection)
+
     request_id = uuid.uuid4().hex
+    annotate(request_id=request_id)
     callback_url = f"{PUBLIC_BASE_URL}/report/webhook/{request_id}"
 
     # Insert initial report to MongoDB
@@ -110,80 +207,296 @@ async def report_json(image: UploadFile = File(...), user=Depends(lambda: {"sub"
         "user_id": user.get("sub"),
         "request_id": request_id,
         "detection": original_detection,
+        "canonical": canonical,
+        "timings": dict(timings),
         "image_url": s3_url,
+        "s3_key": s3_key,
+        # Left unset on failure, so the backfill retries it
+        **({"thumbnail_key": thumbnail_key} if thumbnail_key else {}),
         "status": "pending",
         "created_at": datetime.utcnow()
     }
-    await asyncio.to_thread(coll.insert_one, doc)
-
-    # Prepare agent envelope
-    loop = asyncio.get_running_loop()
-    fut = loop.create_future()
-    PENDING[request_id] = fut
-
-    try:
-        digest = UA_Model.build_schema_digest(DetectionInput)
-    except Exception:
-        digest = "detectioninput-v1"
+    with timed("mongo_insert", timings):
+        await asyncio.to_thread(coll.insert_one, doc)
 
+    priority, _ = current_work_class()
     message = DetectionInput(
         detection_result=original_detection,
         request_id=request_id,
         callback_url=callback_url,
+        traceparent=current_traceparent(),
+        priority=priority,
+        user_id=user.get("sub"),
+        timings=dict(timings),   # includes mongo_insert; stored by the completion write
     )
+    return message, s3_url, canonical
 
-    payload_json = json.dumps(message.model_dump(), separators=(",", ":"), ensure_ascii=False)
-    payload_b64 = base64.b64encode(payload_json.encode()).decode()
+async def _complete_report(request_id: str, final_report: dict, timings: dict,
+                           search_stats: dict | None = None) -> bool:
+    """Mark a report complete, exactly once. Returns False if it already was (duplicate completion)."""
+    update = {
+        "final_report": final_report,
+        "status": "complete",
+        "completed_at": datetime.utcnow(),
+        # Merged into the timings stored at insert
+        **{f"timings.{k}": v for k, v in timings.items()},
+    }
+    if search_stats:
+        update["deep_search"] = search_stats
+    with timed("mongo_update", timings):
+        result = await asyncio.to_thread(
+            coll.update_one,
+            {"request_id": request_id, "status": {"$ne": "complete"}},
+            {"$set": update},
+        )
+    return result.modified_count == 1
 
-    env = Envelope(
-        version=1,
-        sender=_CLIENT_IDENTITY.address if _CLIENT_IDENTITY else "fastapi",
-        target=detect_agent.address,
-        session=uuid.uuid4(),
-        schema_digest=digest,
-        payload=payload_b64,
-    )
-    if _CLIENT_IDENTITY:
-        env.sign(_CLIENT_IDENTITY)
-    envelope = env.model_dump()
-    if envelope.get("session") is not None:
-        envelope["session"] = str(envelope["session"])
-
-    async with httpx.AsyncClient(timeout=30.0) as client_http:
-        r = await client_http.post(DETECT_AGENT_SUBMIT, json=envelope)
-        if r.status_code >= 300:
-            PENDING.pop(request_id, None)
-            raise HTTPException(500, f"detect_agent submit failed: {r.status_code} {r.text[:200]}")
+async def _generate_report(img_bytes: bytes, s3_key: str, user: dict, timings: dict | None = None) -> dict:
+    """Detect and run the agent pipeline for one image stored at s3_key. Returns the /report-json body."""
+    timings = {} if timings is None else timings
+    message, s3_url, canonical = await _ingest_image(img_bytes, s3_key, user, timings)
+    request_id = message.request_id
 
+    # Popular products are answered from the report cache (kept fresh by cache_warmer)
+    cached = await report_cache.lookup(canonical)
+    if cached:
+        final_report = cached["final_report"]
+        await _complete_report(request_id, final_report, timings, {"stop_reason": "cache_hit", "origin": cached["origin"]})
+    elif PIPELINE_MODE == "inprocess":
+        search_stats: dict = {}
+        try:
+            final_report = await asyncio.wait_for(
+                run_pipeline(message, timings=timings, search_stats=search_stats), timeout=PIPELINE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(504, "Timed out waiting for agent pipeline")
+        await _complete_report(request_id, final_report, timings, search_stats)
+        await report_cache.store(canonical, final_report, "pipeline", search_stats)
+    else:
+        # report_webhook stores the completion; this only waits for it
+        # (the API-side timings travel on the message and come back with it)
+        payload = await _submit_to_bureau(message, request_id)
+        final_report = payload.get("final_report")
+        if not isinstance(final_report, dict):
+            raise HTTPException(500, "Webhook did not return final_report")
+        await report_cache.store(canonical, final_report, "pipeline", payload.get("search_stats"))
+
+    # Stored with source ids; clients get the URLs back
+    await sources.hydrate_reports([final_report])
+    return {"request_id": request_id, "final_report": final_report, "image_url": s3_url}
+
+# POST image -> generate report
+@app.post("/report-json")
+async def report_json(image: UploadFile = File(...), user=Depends(rate_limited_user)):
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(400, "Upload must be an image")
+
+    # Bounded read: size-checked, hashed and spooled to disk past SPOOL_MEMORY_LIMIT
+    spool, size, digest = await uploads.spool_upload(image)
+    await image.close()
+    started = False
+
+    async def run():
+        nonlocal started
+        started = True
+        try:
+            with span("report_json", user_id=user.get("sub"), bytes=size), work_class("interactive", user.get("sub")):
+                async with admission.slot():
+                    timings: dict = {}
+                    s3_key = f"images/{uuid.uuid4().hex}.{image.filename.split('.')[-1]}"
+                    with timed("s3_upload", timings, bytes=size):
+                        await asyncio.to_thread(
+                            uploads.upload_spool, s3_client, AWS_S3_BUCKET, s3_key, spool, image.content_type
+                        )
+                    with timed("vision_prepare", timings, bytes=size):
+                        img_bytes = await asyncio.to_thread(uploads.prepare_for_vision, spool)
+                    spool.close()
+                    return await _generate_report(img_bytes, s3_key, user, timings)
+        finally:
+            spool.close()
+
+    # Identical uploads from the same user while one is in flight share its result
     try:
-        payload = await asyncio.wait_for(fut, timeout=90.0)
-    except asyncio.TimeoutError:
-        PENDING.pop(request_id, None)
-        raise HTTPException(504, "Timed out waiting for writer webhook")
+        result = await report_runs.run((user.get("sub"), digest), run)
+    finally:
+        if not started:
+            spool.close()
+    return JSONResponse(result)
+
+class PresignRequest(BaseModel):
+    content_type: str
+    size: int
 
-    final_report = payload.get("final_report")
-    if not isinstance(final_report, dict):
-        raise HTTPException(500, "Webhook did not return final_report")
+class CompleteUploadRequest(BaseModel):
+    key: str
+    upload_id: str
+    parts: List[dict]  # [{"ETag": ..., "PartNumber": ...}] as returned by each part PUT
 
-    # Update MongoDB with final report
-    await asyncio.to_thread(
-        coll.update_one,
-        {"request_id": request_id},
-        {"$set": {"final_report": final_report, "status": "complete", "completed_at": datetime.utcnow()}}
+class ReportFromS3Request(BaseModel):
+    key: str
+
+def _check_upload_key(key: str, user: dict) -> None:
+    if not key.startswith(uploads.user_prefix(user.get("sub"))):
+        raise HTTPException(403, "Upload key does not belong to this user")
+
+# Presigned direct-to-S3 upload: the image bytes never pass through the API
+@app.post("/uploads/presign")
+async def presign_upload(body: PresignRequest, user=Depends(current_user)):
+    return await asyncio.to_thread(
+        uploads.presign_upload, s3_client, AWS_S3_BUCKET, user.get("sub"), body.content_type, body.size
     )
 
-    return JSONResponse({"request_id": request_id, "final_report": final_report, "image_url": s3_url})
+@app.post("/uploads/complete")
+async def complete_upload(body: CompleteUploadRequest, user=Depends(current_user)):
+    _check_upload_key(body.key, user)
+    try:
+        await asyncio.to_thread(
+            uploads.complete_multipart, s3_client, AWS_S3_BUCKET, body.key, body.upload_id, body.parts
+        )
+    except Exception as e:
+        raise HTTPException(400, f"Failed to complete upload: {e}")
+    return {"ok": True, "key": body.key}
+
+# POST S3 key of a presigned upload -> generate report
+@app.post("/report-json/from-s3")
+async def report_json_from_s3(body: ReportFromS3Request, user=Depends(rate_limited_user)):
+    _check_upload_key(body.key, user)
+
+    async def run():
+        with span("report_json_from_s3", user_id=user.get("sub"), key=body.key), \
+                work_class("interactive", user.get("sub")):
+            async with admission.slot():
+                timings: dict = {}
+                with timed("s3_fetch", timings):
+                    spool, _, size = await asyncio.to_thread(
+                        uploads.fetch_object, s3_client, AWS_S3_BUCKET, body.key
+                    )
+                try:
+                    with timed("vision_prepare", timings, bytes=size):
+                        img_bytes = await asyncio.to_thread(uploads.prepare_for_vision, spool)
+                finally:
+                    spool.close()
+                return await _generate_report(img_bytes, body.key, user, timings)
+
+    result = await report_runs.run((user.get("sub"), body.key), run)
+    return JSONResponse(result)
+
+async def _run_batch(batch: list, user: dict):
+    """Yield one NDJSON line per image as its report completes.
+
+    Each image goes on to its deep search as soon as its own detection is done
+    (BATCH_DETECT_CONCURRENCY detections, BATCH_PIPELINE_CONCURRENCY pipelines at
+    a time, both within the global admission slots). The deep searches share one
+    SharedSearch, so images whose research queries match (e.g. several products of
+    the same brand) reuse a Perplexity call that is in flight or done. The stages
+    run in-process regardless of PIPELINE_MODE, since sharing searches needs them
+    in one process. `batch` holds (spool, filename, content_type) tuples; each
+    spool is closed once its image is ingested.
+    """
+    detect_slots = asyncio.Semaphore(BATCH_DETECT_CONCURRENCY)
+    pipeline_slots = asyncio.Semaphore(BATCH_PIPELINE_CONCURRENCY)
+    search = SharedSearch()
+
+    async def ingest(index: int, spool, filename: str, content_type: str):
+        try:
+            async with detect_slots, admission.slot():
+                with work_class("batch", user.get("sub")):
+                    timings: dict = {}
+                    # Original to S3, downscaled copy to the vision model, as in /report-json
+                    s3_key = f"images/{uuid.uuid4().hex}.{filename.split('.')[-1]}"
+                    with timed("s3_upload", timings):
+                        await asyncio.to_thread(
+                            uploads.upload_spool, s3_client, AWS_S3_BUCKET, s3_key, spool, content_type
+                        )
+                    with timed("vision_prepare", timings):
+                        img_bytes = await asyncio.to_thread(uploads.prepare_for_vision, spool)
+                    spool.close()
+                    ingested = await _ingest_image(img_bytes, s3_key, user, timings)
+                return (*ingested, timings)
+        finally:
+            spool.close()
+
+    async def process(index: int, spool, filename: str, content_type: str):
+        line = {"index": index, "filename": filename}
+        try:
+            message, s3_url, canonical, timings = await ingest(index, spool, filename, content_type)
+            line["request_id"] = message.request_id
+            cached = await report_cache.lookup(canonical)
+            if cached:
+                final_report = cached["final_report"]
+                search_stats = {"stop_reason": "cache_hit", "origin": cached["origin"]}
+            else:
+                search_stats = {}
+                async with pipeline_slots, admission.slot():
+                    # run_pipeline schedules its upstream calls as batch work (message.priority)
+                    final_report = await asyncio.wait_for(
+                        run_pipeline(message, timings=timings, search=search.search, search_stats=search_stats),
+                        timeout=PIPELINE_TIMEOUT,
+                    )
+                await report_cache.store(canonical, final_report, "pipeline", search_stats)
+            await _complete_report(message.request_id, final_report, timings, search_stats)
+            await sources.hydrate_reports([final_report])
+            line.update({"status": "complete", "final_report": final_report, "image_url": s3_url})
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e) or type(e).__name__
+            line.update({"status": "error", "error": detail})
+        return json.dumps(line, default=str) + "\n"
+
+    with span("report_batch", user_id=user.get("sub"), images=len(batch)):
+        tasks = [asyncio.ensure_future(process(i, *upload)) for i, upload in enumerate(batch)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away: stop the remaining pipelines
+            for task in tasks:
+                task.cancel()
+
+# POST many images -> stream one report per image (NDJSON)
+@app.post("/report-batch")
+async def report_batch(images: List[UploadFile] = File(...), user=Depends(current_user)):
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(400, f"At most {BATCH_MAX_IMAGES} images per batch")
+    for image in images:
+        if not image.content_type or not image.content_type.startswith("image/"):
+            raise HTTPException(400, f"{image.filename}: upload must be an image")
+    # Every image is a report, charged to the user's batch allowance
+    admission.check_batch_rate(user.get("sub"), len(images))
+
+    batch = []
+    try:
+        for image in images:
+            # Bounded, size-checked reads; spooled to disk past SPOOL_MEMORY_LIMIT
+            spool, _, _ = await uploads.spool_upload(image)
+            await image.close()
+            batch.append((spool, image.filename, image.content_type))
+    except BaseException:
+        for spool, _, _ in batch:
+            spool.close()
+        raise
+    return StreamingResponse(_run_batch(batch, user), media_type="application/x-ndjson")
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # GET reports for user history
 @app.get("/reports")
-async def get_reports(user=Depends(lambda: {"sub": "test_user"})):
-    docs = await asyncio.to_thread(lambda: list(coll.find({"user_id": user["sub"]})))
+async def get_reports(user=Depends(current_user)):
+    with timed("mongo_find"):
+        docs = await asyncio.to_thread(lambda: list(coll.find({"user_id": user["sub"]})))
+    with timed("archive_rehydrate"):
+        docs = await asyncio.to_thread(retention.rehydrate_many, docs)
+    await sources.hydrate_reports([doc.get("final_report") for doc in docs])
     result = []
     for doc in docs:
         result.append({
             "request_id": doc.get("request_id"),
             "detection": doc.get("detection", {}),
             "final_report": doc.get("final_report"),
+            # The list shows thumbnails; the original is only loaded when a report is opened
+            "thumbnail_url": _s3_url(doc["thumbnail_key"]) if doc.get("thumbnail_key") else doc.get("image_url"),
             "image_url": doc.get("image_url"),
             "status": doc.get("status"),
             "created_at": str(doc.get("created_at")) if doc.get("created_at") else None,
@@ -193,35 +506,116 @@ async def get_reports(user=Depends(lambda: {"sub": "test_user"})):
 
 # GET PDF
 @app.get("/report-pdf/{request_id}")
-async def report_pdf(request_id: str, user=Depends(lambda: {"sub": "test_user"})):
-    doc = await asyncio.to_thread(coll.find_one, {"request_id": request_id, "user_id": user.get("sub")})
+async def report_pdf(request_id: str, user=Depends(current_user)):
+    with timed("mongo_find"):
+        doc = await asyncio.to_thread(coll.find_one, {"request_id": request_id, "user_id": user.get("sub")})
+    if doc and doc.get("archived"):
+        with timed("archive_rehydrate"):
+            doc = await asyncio.to_thread(retention.rehydrate, doc)
     if not doc or "final_report" not in doc:
         raise HTTPException(404, "Report not found or incomplete")
+    await sources.hydrate_reports([doc["final_report"]])
     pdf_path = os.path.join(RESULTS_DIR, f"{request_id}.pdf")
-    json_to_pdf(doc["final_report"], pdf_path)
+    with timed("pdf_render"):
+        await asyncio.to_thread(json_to_pdf, doc["final_report"], pdf_path)
     return FileResponse(pdf_path, media_type="application/pdf", filename=f"{request_id}.pdf")
 
 # DELETE report (history remove)
 @app.delete("/report/{request_id}")
-async def delete_report(request_id: str, user=Depends(lambda: {"sub": "test_user"})):
+async def delete_report(request_id: str, user=Depends(current_user)):
     doc = await asyncio.to_thread(coll.find_one, {"request_id": request_id, "user_id": user.get("sub")})
     if not doc:
         raise HTTPException(404, "Report not found")
-    image_url = doc.get("image_url")
-    if image_url:
-        # Handle both us-east-1 and other regions
-        if AWS_REGION == "us-east-1":
-            key = image_url.split(f"https://{AWS_S3_BUCKET}.s3.amazonaws.com/")[-1]
-        else:
-            key = image_url.split(f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/")[-1]
+    for key in (_s3_key(doc), doc.get("thumbnail_key")):
+        if not key:
+            continue
         try:
             await asyncio.to_thread(s3_client.delete_object, Bucket=AWS_S3_BUCKET, Key=key)
         except Exception as e:
             print("Failed to delete image from S3:", e)
 
     await asyncio.to_thread(coll.delete_one, {"request_id": request_id, "user_id": user.get("sub")})
+    if doc.get("archived"):
+        await asyncio.to_thread(retention.delete_archived, [request_id])
     return {"ok": True, "message": "Report deleted successfully"}
 
+class BulkDeleteRequest(BaseModel):
+    request_ids: Optional[List[str]] = None
+    status: Optional[str] = None
+    created_before: Optional[datetime] = None
+    all: bool = False  # required to clear the whole history without another filter
+
+async def _run_bulk_delete(job_id: str, query: dict) -> None:
+    """Delete matching reports in batches: one S3 delete_objects and one Mongo delete_many per batch.
+
+    Reports whose image could not be deleted stay in Mongo so the job can be re-run.
+    """
+    async def progress(**fields):
+        await asyncio.to_thread(delete_jobs.update_one, {"job_id": job_id}, {"$set": {**fields, "updated_at": datetime.utcnow()}})
+
+    deleted = 0
+    failed: set = set()
+    try:
+        total = await asyncio.to_thread(coll.count_documents, query)
+        await progress(status="running", total=total)
+        while True:
+            batch_query = {"$and": [query, {"request_id": {"$nin": list(failed)}}]} if failed else query
+            docs = await asyncio.to_thread(
+                lambda: list(coll.find(batch_query, {"request_id": 1, "s3_key": 1, "image_url": 1, "thumbnail_key": 1}).limit(DELETE_BATCH_SIZE))
+            )
+            if not docs:
+                break
+            keys = {k: d["request_id"] for d in docs for k in (_s3_key(d), d.get("thumbnail_key")) if k}
+            if keys:
+                with timed("s3_delete_batch"):
+                    resp = await asyncio.to_thread(
+                        s3_client.delete_objects,
+                        Bucket=AWS_S3_BUCKET,
+                        Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True},
+                    )
+                for err in resp.get("Errors", []):
+                    print("Failed to delete image from S3:", err.get("Key"), err.get("Message"))
+                    failed.add(keys.get(err.get("Key")))
+            ids = [d["request_id"] for d in docs if d["request_id"] not in failed]
+            if ids:
+                with timed("mongo_delete_many"):
+                    result = await asyncio.to_thread(coll.delete_many, {**query, "request_id": {"$in": ids}})
+                    await asyncio.to_thread(retention.delete_archived, ids)
+                deleted += result.deleted_count
+            await progress(deleted=deleted, s3_errors=len(failed))
+        await progress(status="complete", finished_at=datetime.utcnow())
+    except Exception as e:
+        print("Bulk delete failed:", e)
+        await progress(status="failed", error=str(e))
+
+# DELETE many reports (list or filter); runs in the background, poll for progress
+@app.post("/reports/delete", status_code=202)
+async def bulk_delete_reports(body: BulkDeleteRequest, background: BackgroundTasks, user=Depends(current_user)):
+    query: dict = {"user_id": user.get("sub")}
+    if body.request_ids is not None:
+        query["request_id"] = {"$in": body.request_ids}
+    if body.status:
+        query["status"] = body.status
+    if body.created_before:
+        query["created_at"] = {"$lt": body.created_before}
+    if len(query) == 1 and not body.all:
+        raise HTTPException(400, "Give request_ids, a filter, or all=true")
+
+    job_id = uuid.uuid4().hex
+    await asyncio.to_thread(delete_jobs.insert_one, {
+        "job_id": job_id, "user_id": user.get("sub"), "status": "queued",
+        "total": None, "deleted": 0, "s3_errors": 0, "created_at": datetime.utcnow(),
+    })
+    background.add_task(_run_bulk_delete, job_id, query)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/reports/delete/{job_id}")
+async def bulk_delete_progress(job_id: str, user=Depends(current_user)):
+    job = await asyncio.to_thread(delete_jobs.find_one, {"job_id": job_id, "user_id": user.get("sub")}, {"_id": 0})
+    if not job:
+        raise HTTPException(404, "Delete job not found")
+    return job
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8080, reload=True)
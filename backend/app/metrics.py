@@ -0,0 +1,138 @@
+"""
+Prometheus metrics shared by the API and the agents.
+
+The API serves them on /metrics (see main.py); the Bureau process starts its own
+exporter on BUREAU_METRICS_PORT (see agents.py).
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .tracing import span
+
+# Pipeline stages: s3_upload, gemini_detect, mongo_*, envelope_submit, perplexity,
+# clean_evidence, groq_writer, webhook, pdf_render
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds", "Duration of one pipeline stage", ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90),
+)
+STAGE_ERRORS = Counter(
+    "stage_errors_total", "Pipeline stages that raised", ["stage"]
+)
+
+
+@contextmanager
+def timed(stage: str, timings: Optional[Dict[str, float]] = None, key: Optional[str] = None, **attributes):
+    """Observe the block's duration under `stage` and trace it as a span.
+
+    When a timings dict is given, the duration (seconds) is also added to
+    timings[key or stage] so it can be stored on the report document.
+    """
+    start = time.perf_counter()
+    try:
+        with span(stage, **attributes):
+            yield
+    except Exception:
+        STAGE_ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        if timings is not None:
+            name = key or stage
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 4)
+
+# Admission control (admission.py)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Report pipelines currently running"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Report requests waiting for a pipeline slot"
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds", "Time spent waiting for a pipeline slot",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Report requests rejected by admission control", ["reason"]
+)
+
+# Request coalescing (coalesce.py)
+COALESCED_REQUESTS = Counter(
+    "coalesced_requests_total", "Requests that attached to an identical in-flight pipeline"
+)
+
+# Batch uploads (main.report_batch)
+SHARED_SEARCH_HITS = Counter(
+    "shared_search_hits_total", "Research queries answered by a search already made for another image in the batch"
+)
+
+# Barcode fast path (DetectService / barcode.py): hit, miss, no_barcode, error
+BARCODE_FASTPATH = Counter(
+    "barcode_fastpath_total", "Barcode fast-path outcomes before the vision model", ["result"]
+)
+
+# Retention (retention.py)
+RETENTION_ARCHIVED = Counter(
+    "retention_archived_total", "Reports moved to the compressed archive"
+)
+RETENTION_BACKLOG = Gauge(
+    "retention_backlog", "Reports old enough to archive that are not archived yet"
+)
+RETENTION_LAST_RUN = Gauge(
+    "retention_last_run_timestamp_seconds", "When the last retention pass finished"
+)
+
+# Writer outbox (outbox.py): delivered, retry, failed
+OUTBOX_DELIVERIES = Counter(
+    "outbox_deliveries_total", "Writer webhook delivery attempts by outcome", ["result"]
+)
+
+# Upstream rate scheduler (scheduler.py)
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "upstream_queue_depth", "Upstream calls waiting for a rate-limit token", ["upstream", "priority"]
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "upstream_queue_wait_seconds", "Time an upstream call waited for a rate-limit token", ["upstream", "priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+
+# Query planner (query_planner.py): proposed by detection vs planned for search
+RESEARCH_QUERIES = Counter(
+    "research_queries_total", "Research queries before and after planning", ["stage"]
+)
+
+# Deep search early termination (agents.run_deep_search): completed, low_gain, time_budget
+DEEP_SEARCH_STOPS = Counter(
+    "deep_search_stops_total", "Why deep search stopped issuing queries", ["reason"]
+)
+
+# Upstream health (resilience.py)
+UPSTREAM_BREAKER_STATE = Gauge(
+    "upstream_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ["upstream"]
+)
+UPSTREAM_CALLS = Counter(
+    "upstream_calls_total", "Upstream attempts by outcome (ok, error, rejected by the breaker)", ["upstream", "result"]
+)
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedges_total", "Hedged attempts launched, and how many finished first", ["upstream", "outcome"]
+)
+UPSTREAM_P95 = Gauge(
+    "upstream_hedge_delay_seconds", "Current hedge delay (recent p95 latency) per upstream", ["upstream"]
+)
+
+# Report cache (report_cache.py): hit, hit_warm (entry written by the warmer), miss
+REPORT_CACHE_LOOKUPS = Counter(
+    "report_cache_lookups_total", "Report cache lookups by outcome", ["result"]
+)
+# Cache warming (cache_warmer.py): warmed, fresh (skipped), failed
+CACHE_WARM_RUNS = Counter(
+    "cache_warm_products_total", "Products handled by the cache warmer", ["outcome"]
+)
+
+# Thumbnails (thumbnails.py): source upload | backfill, result created | failed
+THUMBNAILS = Counter(
+    "thumbnails_total", "Thumbnails rendered and stored", ["source", "result"]
+)
@@ -0,0 +1,133 @@
+"""
+Writer outbox: webhook deliveries that survive failures and restarts.
+
+The writer stores each completion here before POSTing it. A failed delivery is
+retried with exponential backoff (plus jitter) by the writer agent's interval
+task until the API acknowledges it, rejects it with a 4xx (other than 408/429),
+or OUTBOX_MAX_ATTEMPTS is reached.
+
+There is one delivery per request (delivery_id = request_id), sent with an
+Idempotency-Key header; the API side applies it with a compare-and-set, so
+repeated deliveries are harmless.
+"""
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import httpx
+from pymongo import ReturnDocument
+
+from .codec import pack, unpack
+from .db import client
+from .metrics import timed, OUTBOX_DELIVERIES
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BASE_DELAY = float(os.getenv("OUTBOX_BASE_DELAY", "1.0"))
+OUTBOX_MAX_DELAY = float(os.getenv("OUTBOX_MAX_DELAY", "300"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_LEASE_SECONDS = 60   # a claimed entry is not picked up again for this long
+OUTBOX_TTL_SECONDS = int(os.getenv("OUTBOX_TTL_SECONDS", str(7 * 86400)))
+
+outbox = client[DB_NAME]["writer_outbox"]
+
+try:
+    outbox.create_index("delivery_id", unique=True)
+    outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+    outbox.create_index("created_at", expireAfterSeconds=OUTBOX_TTL_SECONDS)
+except Exception as e:
+    print("Failed to create writer_outbox indexes:", e)
+
+
+def backoff(attempts: int) -> float:
+    delay = min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * (2 ** attempts))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def enqueue(request_id: str, callback_url: str, body: Dict[str, Any],
+                  traceparent: Optional[str] = None) -> Dict[str, Any]:
+    """Store a completion; returns the entry (an existing one if this request was already enqueued)."""
+    now = datetime.utcnow()
+    with timed("mongo_outbox_enqueue"):
+        return await asyncio.to_thread(
+            outbox.find_one_and_update,
+            {"delivery_id": request_id},
+            {"$setOnInsert": {
+                "delivery_id": request_id,
+                "callback_url": callback_url,
+                "body": pack(body),
+                "traceparent": traceparent,
+                "status": "pending",
+                "attempts": 0,
+                # Leased to the caller, which delivers right away
+                "next_attempt_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                "created_at": now,
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+
+async def deliver(entry: Dict[str, Any]) -> bool:
+    """POST one entry and record the outcome. Returns True once the API acknowledged it."""
+    if entry.get("status") != "pending":
+        return entry.get("status") == "delivered"
+    headers = {"Idempotency-Key": entry["delivery_id"]}
+    if entry.get("traceparent"):
+        headers["traceparent"] = entry["traceparent"]
+    error = None
+    try:
+        async with httpx.AsyncClient(timeout=30.0) as client_http:
+            r = await client_http.post(entry["callback_url"], json=unpack(entry["body"]), headers=headers)
+        if r.status_code < 300:
+            await asyncio.to_thread(
+                outbox.update_one,
+                {"_id": entry["_id"]},
+                {"$set": {"status": "delivered", "delivered_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            )
+            OUTBOX_DELIVERIES.labels(result="delivered").inc()
+            return True
+        error = f"HTTP {r.status_code}: {r.text[:200]}"
+        # Any other 4xx rejects the delivery itself; sending it again cannot succeed
+        permanent = 400 <= r.status_code < 500 and r.status_code not in (408, 429)
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        permanent = False
+
+    attempts = entry.get("attempts", 0) + 1
+    gave_up = permanent or attempts >= OUTBOX_MAX_ATTEMPTS
+    await asyncio.to_thread(
+        outbox.update_one,
+        {"_id": entry["_id"]},
+        {"$set": {
+            "status": "failed" if gave_up else "pending",
+            "attempts": attempts,
+            "last_error": error,
+            "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff(attempts)),
+        }},
+    )
+    OUTBOX_DELIVERIES.labels(result="failed" if gave_up else "retry").inc()
+    print(f"Webhook delivery {entry['delivery_id']} failed (attempt {attempts}): {error}")
+    return False
+
+
+async def deliver_due(limit: int = 50) -> int:
+    """Retry pending entries whose backoff has elapsed. Returns how many were attempted."""
+    attempted = 0
+    while attempted < limit:
+        now = datetime.utcnow()
+        # Claim by pushing next_attempt_at forward, so concurrent writers skip it
+        entry = await asyncio.to_thread(
+            outbox.find_one_and_update,
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"$set": {"next_attempt_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if entry is None:
+            break
+        await deliver(entry)
+        attempted += 1
+    return attempted
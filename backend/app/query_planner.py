@@ -0,0 +1,89 @@
+"""
+Research query planning for the deep search stage.
+
+Gemini's research_queries overlap heavily ("Monster Energy recall" /
+"Monster Energy drink recall"). plan_queries():
+
+1. clusters near-identical queries (rapidfuzz token_set_ratio, same intents)
+   and keeps the most specific one of each cluster
+2. makes sure the recall, lawsuit and warning intents are each covered by at
+   least one query, adding one combined query for any that are missing
+3. orders queries by expected yield (intent coverage first, then specificity)
+   and drops the tail beyond PLANNER_MAX_QUERIES
+"""
+import os
+from typing import Any, Dict, List, Set
+
+from rapidfuzz import fuzz
+from rapidfuzz.utils import default_process
+
+PLANNER_SIMILARITY = int(os.getenv("PLANNER_SIMILARITY", "85"))
+PLANNER_MAX_QUERIES = int(os.getenv("PLANNER_MAX_QUERIES", "3"))
+
+INTENT_KEYWORDS = {
+    "recall": ("recall", "recalls", "recalled", "withdrawn", "withdrawal"),
+    "lawsuit": ("lawsuit", "lawsuits", "litigation", "sued", "class action", "settlement"),
+    "warning": ("warning", "warnings", "advisory", "alert", "fda", "caution", "complaint", "adverse"),
+}
+
+
+def intents(query: str) -> Set[str]:
+    text = f" {default_process(query)} "
+    return {intent for intent, words in INTENT_KEYWORDS.items() if any(f" {w} " in text for w in words)}
+
+
+def _subject(product: Dict[str, Any]) -> str:
+    parts = [product.get("brand"), product.get("product_name")]
+    seen, words = set(), []
+    for word in " ".join(p for p in parts if p).split():
+        if word.lower() not in seen:
+            seen.add(word.lower())
+            words.append(word)
+    return " ".join(words)
+
+
+def _score(query: str, subject_tokens: Set[str]) -> float:
+    tokens = set(default_process(query).split())
+    score = 2.0 * len(intents(query))
+    score += len(tokens & subject_tokens) / max(1, len(subject_tokens))   # names the product
+    if tokens and all(t.isdigit() or t == "upc" for t in tokens):
+        score -= 2.0   # bare barcode lookups rarely return safety evidence
+    return score
+
+
+def plan_queries(queries: List[str], product: Dict[str, Any], max_queries: int = PLANNER_MAX_QUERIES) -> List[str]:
+    subject = _subject(product)
+    subject_tokens = set(default_process(subject).split())
+
+    # 1. cluster near-duplicates; a cluster is represented by its most specific query
+    clusters: List[str] = []
+    for query in (q.strip() for q in queries if q and q.strip()):
+        for i, rep in enumerate(clusters):
+            if intents(rep) == intents(query) and fuzz.token_set_ratio(
+                rep, query, processor=default_process
+            ) >= PLANNER_SIMILARITY:
+                if len(default_process(query).split()) > len(default_process(rep).split()):
+                    clusters[i] = query
+                break
+        else:
+            clusters.append(query)
+
+    # 2. intent coverage
+    covered = set().union(*(intents(q) for q in clusters)) if clusters else set()
+    missing = [i for i in INTENT_KEYWORDS if i not in covered]
+    if missing and subject:
+        clusters.append(f"{subject} {' '.join(missing)}")
+
+    # 3. order by expected yield; keep every query needed for coverage, then fill up to max_queries
+    ranked = sorted(clusters, key=lambda q: _score(q, subject_tokens), reverse=True)
+    plan, covered = [], set()
+    for query in ranked:
+        if intents(query) - covered:
+            plan.append(query)
+            covered |= intents(query)
+    for query in ranked:
+        if len(plan) >= max_queries:
+            break
+        if query not in plan:
+            plan.append(query)
+    return plan
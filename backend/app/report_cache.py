@@ -0,0 +1,83 @@
+"""
+Finished reports cached per canonical (brand, product_name).
+
+A scan of a product with a fresh entry is answered from the cache instead of
+running deep search and the writer. Entries come from completed pipelines
+(origin "pipeline") and from the off-peak warmer (origin "warm", see
+cache_warmer.py); hits on warmed entries are the interactive runs it saved.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from .db import client
+from .metrics import timed, REPORT_CACHE_LOOKUPS
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+REPORT_CACHE_TTL_HOURS = float(os.getenv("REPORT_CACHE_TTL_HOURS", "168"))  # 0 disables lookups
+
+cache = client[DB_NAME]["report_cache"]
+
+try:
+    cache.create_index("key", unique=True)
+except Exception as e:
+    print("Failed to create report_cache index:", e)
+
+
+def cache_key(canonical: Dict[str, Optional[str]]) -> Optional[str]:
+    if not canonical or not canonical.get("product_name"):
+        return None
+    return f"{(canonical.get('brand') or '').lower()}|{canonical['product_name'].lower()}"
+
+
+async def lookup(canonical: Dict[str, Optional[str]]) -> Optional[Dict[str, Any]]:
+    """Fresh cached entry for the product, or None. Counts the hit on the entry."""
+    key = cache_key(canonical)
+    if key is None or REPORT_CACHE_TTL_HOURS <= 0:
+        return None
+    fresh_after = datetime.utcnow() - timedelta(hours=REPORT_CACHE_TTL_HOURS)
+    with timed("mongo_cache_lookup"):
+        entry = await asyncio.to_thread(
+            cache.find_one_and_update,
+            {"key": key, "refreshed_at": {"$gte": fresh_after}},
+            {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}},
+            {"_id": 0},
+        )
+    if entry is None:
+        REPORT_CACHE_LOOKUPS.labels(result="miss").inc()
+        return None
+    REPORT_CACHE_LOOKUPS.labels(result="hit_warm" if entry.get("origin") == "warm" else "hit").inc()
+    if entry.get("origin") == "warm":
+        await asyncio.to_thread(cache.update_one, {"key": key}, {"$inc": {"saved_by_warm": 1}})
+    return entry
+
+
+async def store(canonical: Dict[str, Optional[str]], final_report: Dict[str, Any], origin: str,
+                search_stats: Optional[Dict[str, Any]] = None) -> None:
+    key = cache_key(canonical)
+    if key is None:
+        return
+    with timed("mongo_cache_store"):
+        await asyncio.to_thread(
+            cache.update_one,
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "canonical": canonical,
+                "final_report": final_report,
+                "search_stats": search_stats or {},
+                "origin": origin,
+                "refreshed_at": datetime.utcnow(),
+            }, "$setOnInsert": {"hits": 0, "saved_by_warm": 0}},
+            upsert=True,
+        )
+
+
+async def age(canonical: Dict[str, Optional[str]]) -> Optional[timedelta]:
+    """How old the product's cache entry is; None when there is none."""
+    key = cache_key(canonical)
+    if key is None:
+        return None
+    entry = await asyncio.to_thread(cache.find_one, {"key": key}, {"refreshed_at": 1})
+    return datetime.utcnow() - entry["refreshed_at"] if entry else None
@@ -0,0 +1,201 @@
+"""
+Hedged requests and circuit breakers for the Gemini, Perplexity and Groq calls.
+
+    result = await resilience.call("perplexity", attempt, is_failure=lambda r: r["status_code"] >= 500)
+
+- each attempt takes a scheduler token (scheduler.py), then is bounded by the
+  upstream's timeout; time spent queued for the token is not held against it
+- hedging: if the first attempt has not answered p95 after it was sent (the
+  upstream's recent p95 latency; the wait for its token does not count), a second
+  identical attempt starts and the first response wins (the other is cancelled).
+  There is no hedging until MIN_SAMPLES latencies are known, nor while other calls
+  are queued for the upstream's tokens - the quota is tight then, and a hedge would
+  take a token from them
+- circuit breaker: after `failures` consecutive failures the upstream is
+  rejected immediately (CircuitOpen) for `reset` seconds, then one probe call
+  decides whether it closes again
+
+Per-upstream settings, RESILIENCE_<GEMINI|PERPLEXITY|GROQ>_<NAME>:
+    HEDGE=1|0   HEDGE_QUANTILE=0.95   HEDGE_MIN_DELAY=1.0
+    TIMEOUT=30  BREAKER_FAILURES=5    BREAKER_RESET=30
+
+Gemini hedging is off by default: its SDK call runs in a thread that cannot be
+cancelled, so a losing attempt would still spend quota. Groq hedging is off too:
+writer generations routinely run past p95 and are billed even when cancelled.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from . import scheduler
+from .metrics import UPSTREAM_BREAKER_STATE, UPSTREAM_CALLS, UPSTREAM_HEDGES, UPSTREAM_P95
+
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(RuntimeError):
+    """The upstream's breaker is open; the call was not attempted."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+@dataclass
+class Policy:
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 1.0
+    timeout: float = 30.0
+    breaker_failures: int = 5
+    breaker_reset: float = 30.0
+
+    @classmethod
+    def from_env(cls, upstream: str, **defaults) -> "Policy":
+        policy = cls(**defaults)
+        prefix = f"RESILIENCE_{upstream.upper()}_"
+        for name, value in vars(policy).items():
+            raw = os.getenv(prefix + name.upper())
+            if raw is not None:
+                setattr(policy, name, raw.lower() in ("1", "true", "yes") if isinstance(value, bool) else type(value)(raw))
+        return policy
+
+
+@dataclass
+class UpstreamHealth:
+    name: str
+    policy: Policy
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    state: str = "closed"
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    probing: bool = False
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        UPSTREAM_BREAKER_STATE.labels(upstream=self.name).set(BREAKER_STATES[state])
+
+    def hedge_delay(self) -> Optional[float]:
+        """Recent latency quantile; None (do not hedge) until MIN_SAMPLES latencies are known."""
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        p = ordered[min(len(ordered) - 1, int(self.policy.hedge_quantile * len(ordered)))]
+        return max(self.policy.hedge_min_delay, p)
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a call may go out now."""
+        if self.state == "open":
+            remaining = self.opened_at + self.policy.breaker_reset - time.monotonic()
+            if remaining > 0:
+                UPSTREAM_CALLS.labels(upstream=self.name, result="rejected").inc()
+                raise CircuitOpen(self.name, remaining)
+            self._set_state("half_open")
+        if self.state == "half_open":
+            if self.probing:
+                UPSTREAM_CALLS.labels(upstream=self.name, result="rejected").inc()
+                raise CircuitOpen(self.name, self.policy.breaker_reset)
+            self.probing = True
+
+    def record(self, ok: bool, latency: Optional[float] = None) -> None:
+        UPSTREAM_CALLS.labels(upstream=self.name, result="ok" if ok else "error").inc()
+        self.probing = False
+        if ok:
+            self.consecutive_failures = 0
+            if latency is not None:
+                self.latencies.append(latency)
+                if len(self.latencies) >= MIN_SAMPLES:
+                    UPSTREAM_P95.labels(upstream=self.name).set(self.hedge_delay())
+            if self.state != "closed":
+                self._set_state("closed")
+            return
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.policy.breaker_failures:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+
+health: Dict[str, UpstreamHealth] = {
+    "gemini": UpstreamHealth("gemini", Policy.from_env("gemini", hedge=False)),
+    "perplexity": UpstreamHealth("perplexity", Policy.from_env("perplexity")),
+    "groq": UpstreamHealth("groq", Policy.from_env("groq", hedge=False)),
+}
+for _h in health.values():
+    _h._set_state("closed")
+
+
+async def _attempt(h: UpstreamHealth, fn: Callable[[], Awaitable[Any]],
+                   is_failure: Optional[Callable[[Any], bool]], sent: Optional[asyncio.Event] = None) -> Any:
+    try:
+        await scheduler.acquire(h.name)
+        if sent is not None:
+            sent.set()
+        start = time.monotonic()
+        result = await asyncio.wait_for(fn(), timeout=h.policy.timeout)
+    except asyncio.CancelledError:
+        h.probing = False   # a cancelled hedge must not hold the half-open probe
+        raise
+    except Exception:
+        h.record(False)
+        raise
+    failed = bool(is_failure and is_failure(result))
+    h.record(not failed, None if failed else time.monotonic() - start)
+    return result
+
+
+async def call(upstream: str, fn: Callable[[], Awaitable[Any]],
+               is_failure: Optional[Callable[[Any], bool]] = None) -> Any:
+    """Run fn() under the upstream's breaker, timeout and hedging policy.
+
+    `is_failure(result)` marks returned (not raised) errors, e.g. HTTP 5xx bodies;
+    those count against the breaker and lose to a hedge that succeeds.
+    """
+    h = health[upstream]
+    h.allow()
+    sent = asyncio.Event()
+    first = asyncio.ensure_future(_attempt(h, fn, is_failure, sent))
+    tasks = {first}
+    try:
+        delay = h.hedge_delay()
+        if not h.policy.hedge or delay is None:
+            return await first
+
+        # The hedge delay runs from when the first attempt goes out, not from when it queued for a token
+        sent_wait = asyncio.ensure_future(sent.wait())
+        try:
+            await asyncio.wait({first, sent_wait}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sent_wait.cancel()
+        if not first.done():
+            await asyncio.wait(tasks, timeout=delay)
+        if first.done() or scheduler.congested(upstream):
+            return await first
+
+        try:
+            h.allow()
+            tasks.add(asyncio.ensure_future(_attempt(h, fn, is_failure)))
+            UPSTREAM_HEDGES.labels(upstream=upstream, outcome="launched").inc()
+        except CircuitOpen:
+            pass   # breaker tripped meanwhile; just wait for the first attempt
+
+        fallback = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and not (is_failure and is_failure(task.result())):
+                    if task is not first:
+                        UPSTREAM_HEDGES.labels(upstream=upstream, outcome="won").inc()
+                    return task.result()
+                fallback = task
+        return fallback.result()   # every attempt failed: surface the last one
+    finally:
+        # The loser, or everything when our caller gave up
+        for task in tasks:
+            task.cancel()
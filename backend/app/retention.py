@@ -0,0 +1,122 @@
+"""
+Tiered retention for reports.
+
+Completed reports older than RETENTION_DAYS move their bulky fields (detection,
+final_report, timings) into the reports_archive collection as one codec-packed
+blob (msgpack+zstd when installed). The hot document stays behind as a tombstone
+with archived=True and the small fields history needs (ids, image, status,
+dates, canonical), so the hot collection's working set stops growing with history.
+
+rehydrate() / rehydrate_many() merge the archived fields back on read, so
+/reports and /report-pdf work the same for archived reports.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from pymongo.errors import BulkWriteError
+
+from .codec import pack, unpack
+from .db import client
+from .metrics import timed, RETENTION_ARCHIVED, RETENTION_BACKLOG, RETENTION_LAST_RUN
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "90"))  # 0 disables archiving
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+RETENTION_THROTTLE_SECONDS = float(os.getenv("RETENTION_THROTTLE_SECONDS", "1.0"))  # pause between batches
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+
+ARCHIVED_FIELDS = ("detection", "final_report", "timings")
+
+archive = client[DB_NAME]["reports_archive"]
+
+try:
+    archive.create_index("request_id", unique=True)
+except Exception as e:
+    print("Failed to create reports_archive index:", e)
+
+
+def _eligible(cutoff: datetime) -> Dict[str, Any]:
+    return {"status": "complete", "archived": {"$ne": True}, "created_at": {"$lt": cutoff}}
+
+
+def archive_batch(coll, cutoff: datetime, limit: int = RETENTION_BATCH_SIZE) -> int:
+    """Archive up to `limit` eligible reports. Returns how many were moved."""
+    docs = list(coll.find(_eligible(cutoff), {"_id": 0}).limit(limit))
+    if not docs:
+        return 0
+
+    entries = [{
+        "request_id": d["request_id"],
+        "user_id": d.get("user_id"),
+        "blob": pack({f: d.get(f) for f in ARCHIVED_FIELDS}),
+        "archived_at": datetime.utcnow(),
+    } for d in docs]
+    try:
+        archive.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Already archived by an earlier, interrupted run: the blob is there, finish the tombstone
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+    # Only strip the hot document once its archive copy is written
+    ids = [d["request_id"] for d in docs]
+    coll.update_many(
+        {"request_id": {"$in": ids}},
+        {"$set": {"archived": True, "archived_at": datetime.utcnow()},
+         "$unset": {f: "" for f in ARCHIVED_FIELDS}},
+    )
+    return len(ids)
+
+
+async def run_once(coll, days: float = RETENTION_DAYS) -> int:
+    """Archive everything older than `days`, one throttled batch at a time."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    RETENTION_BACKLOG.set(await asyncio.to_thread(coll.count_documents, _eligible(cutoff)))
+    moved = 0
+    while True:
+        with timed("retention_archive_batch"):
+            n = await asyncio.to_thread(archive_batch, coll, cutoff)
+        if not n:
+            break
+        moved += n
+        RETENTION_ARCHIVED.inc(n)
+        RETENTION_BACKLOG.dec(n)
+        await asyncio.sleep(RETENTION_THROTTLE_SECONDS)
+    RETENTION_BACKLOG.set(0)
+    RETENTION_LAST_RUN.set_to_current_time()
+    return moved
+
+
+async def run_forever(coll) -> None:
+    if RETENTION_DAYS <= 0:
+        return
+    while True:
+        try:
+            moved = await run_once(coll)
+            if moved:
+                print(f"Archived {moved} reports older than {RETENTION_DAYS:g} days")
+        except Exception as e:
+            print("Retention run failed:", e)
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
+
+def rehydrate_many(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge archived fields back into tombstones (one archive query for the whole list)."""
+    ids = [d["request_id"] for d in docs if d.get("archived")]
+    if not ids:
+        return docs
+    blobs = {a["request_id"]: a["blob"] for a in archive.find({"request_id": {"$in": ids}}, {"request_id": 1, "blob": 1})}
+    for d in docs:
+        if d.get("archived") and d["request_id"] in blobs:
+            d.update(unpack(blobs[d["request_id"]]))
+    return docs
+
+
+def rehydrate(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return rehydrate_many([doc])[0] if doc else doc
+
+
+def delete_archived(request_ids: List[str]) -> None:
+    archive.delete_many({"request_id": {"$in": request_ids}})
@@ -0,0 +1,149 @@
+"""
+Upstream rate scheduler for the Gemini, Perplexity and Groq calls.
+
+Each upstream gets a token bucket sized to its quota. A call takes a token
+before it goes out; when none is left it queues here instead of being sent
+and burning quota on a 429. Queued calls are granted:
+
+- by priority class: interactive (single uploads) before batch before warm
+  (cache warming), so background work never delays a user who is waiting
+- round-robin between users within a class, so one large batch cannot starve
+  other users' batches
+
+The class and user come from work_class(), set by the API per request and by
+the agents from the message fields, so they follow a report through the Bureau.
+
+    SCHEDULER_<GEMINI|PERPLEXITY|GROQ>_RATE   requests per second (0 = unlimited)
+    SCHEDULER_<...>_BURST                      bucket size
+
+Buckets are per process; size them to the share of the quota each process gets.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from .admission import TokenBucket
+from .metrics import UPSTREAM_QUEUE_DEPTH, UPSTREAM_QUEUE_WAIT
+
+PRIORITIES = ("interactive", "batch", "warm")
+
+DEFAULT_LIMITS = {
+    # (rate per second, burst)
+    "gemini": (2.0, 10),
+    "perplexity": (0.8, 5),
+    "groq": (0.5, 5),
+}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_priority", default="interactive")
+_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("upstream_user", default=None)
+
+
+@contextmanager
+def work_class(priority: str = "interactive", user_id: Optional[str] = None):
+    """Upstream calls made inside the block are scheduled as `priority` work for `user_id`."""
+    if priority not in PRIORITIES:
+        priority = "interactive"
+    p_token, u_token = _priority.set(priority), _user.set(user_id)
+    try:
+        yield
+    finally:
+        _priority.reset(p_token)
+        _user.reset(u_token)
+
+
+def current_work_class() -> Tuple[str, Optional[str]]:
+    return _priority.get(), _user.get()
+
+
+class UpstreamScheduler:
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        # priority -> user -> waiting futures; OrderedDict order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _pending(self) -> bool:
+        return any(self._queues[p] for p in PRIORITIES)
+
+    def _next(self) -> Optional[asyncio.Future]:
+        for p in PRIORITIES:
+            users = self._queues[p]
+            while users:
+                user, waiters = next(iter(users.items()))
+                while waiters and waiters[0].done():   # caller gave up (cancelled / timed out)
+                    waiters.popleft()
+                if not waiters:
+                    del users[user]
+                    continue
+                fut = waiters.popleft()
+                if waiters:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                return fut
+        return None
+
+    async def _dispatch(self) -> None:
+        try:
+            while self._pending():
+                wait = self.bucket.take()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                fut = self._next()
+                if fut is None:
+                    self.bucket.tokens += 1   # everyone left the queue; give the token back
+                    break
+                fut.set_result(None)
+        finally:
+            self._dispatcher = None
+
+    async def acquire(self) -> None:
+        """Wait for this upstream's next token under the current work class."""
+        if self.bucket is None:
+            return
+        priority, user = current_work_class()
+        # Nobody queued: take a token directly if one is there
+        if not self._pending() and self.bucket.take() == 0:
+            UPSTREAM_QUEUE_WAIT.labels(upstream=self.name, priority=priority).observe(0)
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user or "", deque()).append(fut)
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        depth = UPSTREAM_QUEUE_DEPTH.labels(upstream=self.name, priority=priority)
+        depth.inc()
+        queued_at = time.monotonic()
+        try:
+            await fut
+        finally:
+            depth.dec()
+            UPSTREAM_QUEUE_WAIT.labels(upstream=self.name, priority=priority).observe(time.monotonic() - queued_at)
+
+
+def _from_env(name: str) -> UpstreamScheduler:
+    rate, burst = DEFAULT_LIMITS[name]
+    prefix = f"SCHEDULER_{name.upper()}"
+    return UpstreamScheduler(
+        name,
+        float(os.getenv(f"{prefix}_RATE", str(rate))),
+        float(os.getenv(f"{prefix}_BURST", str(burst))),
+    )
+
+
+schedulers: Dict[str, UpstreamScheduler] = {name: _from_env(name) for name in DEFAULT_LIMITS}
+
+
+async def acquire(upstream: str) -> None:
+    await schedulers[upstream].acquire()
+
+
+def congested(upstream: str) -> bool:
+    """True while calls are queued for the upstream's tokens."""
+    return schedulers[upstream]._pending()
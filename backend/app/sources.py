@@ -0,0 +1,144 @@
+"""
+Content-addressed source store.
+
+Citations are canonicalized (scheme/host lowercased, fragment, tracking
+parameters and trailing slash dropped) and keyed by a hash of that URL. Agent
+messages, the writer prompt and stored reports carry the short ids; the
+`sources` collection holds each URL once, however many reports cite it.
+
+    sid = intern(table, "https://www.fda.gov/recalls?utm_source=x#top")
+    await store(table)                       # upsert new ids into Mongo
+    await resolve([sid])                     # -> {sid: {"url": ..., "title": ...}}
+    await hydrate_reports([final_report])    # source_ids -> source_urls for clients
+"""
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from pymongo import UpdateOne
+
+from .db import client
+from .metrics import timed
+
+DB_NAME = os.environ.get("MONGO_DB", "cruzhack")
+SOURCE_CACHE_SIZE = int(os.getenv("SOURCE_CACHE_SIZE", "10000"))
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src", "_ga", "_gl"}
+EXAMPLE_KINDS = ("lawsuits", "recalls", "warnings")
+
+sources = client[DB_NAME]["sources"]
+
+# id -> {"url", "title"}, in front of Mongo; ids are content hashes so entries never go stale
+_cache: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+
+def canonical_url(url: str) -> str:
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.netloc:
+        return url
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def source_id(url: str) -> str:
+    return hashlib.sha256(canonical_url(url).encode()).hexdigest()[:12]
+
+
+def _as_entry(source: Any) -> Dict[str, str]:
+    if isinstance(source, dict):
+        url = source.get("url") or source.get("source") or ""
+        return {"url": canonical_url(str(url)), "title": str(source.get("title") or url)}
+    return {"url": canonical_url(str(source)), "title": str(source)}
+
+
+def intern(table: Dict[str, Dict[str, str]], source: Any) -> str:
+    """Add a source (URL string or normalize_sources() dict) to `table`; return its id."""
+    entry = _as_entry(source)
+    sid = source_id(entry["url"])
+    table.setdefault(sid, entry)
+    return sid
+
+
+def _cache_put(sid: str, entry: Dict[str, str]) -> None:
+    _cache[sid] = entry
+    _cache.move_to_end(sid)
+    while len(_cache) > SOURCE_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def store(table: Dict[str, Dict[str, str]]) -> None:
+    """Upsert sources not seen by this process yet."""
+    new = {sid: e for sid, e in table.items() if sid not in _cache}
+    if new:
+        now = datetime.utcnow()
+        ops = [
+            UpdateOne({"_id": sid}, {"$setOnInsert": {**e, "first_seen": now}}, upsert=True)
+            for sid, e in new.items()
+        ]
+        with timed("mongo_sources_upsert"):
+            await asyncio.to_thread(sources.bulk_write, ops, ordered=False)
+    for sid, e in table.items():
+        _cache_put(sid, e)
+
+
+async def resolve(ids: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    ids = set(ids)
+    found = {sid: _cache[sid] for sid in ids if sid in _cache}
+    missing = list(ids - found.keys())
+    if missing:
+        with timed("mongo_sources_find"):
+            docs = await asyncio.to_thread(
+                lambda: list(sources.find({"_id": {"$in": missing}}, {"url": 1, "title": 1}))
+            )
+        for d in docs:
+            entry = {"url": d["url"], "title": d.get("title") or d["url"]}
+            _cache_put(d["_id"], entry)
+            found[d["_id"]] = entry
+    return found
+
+
+def _examples(report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    notable = report.get("key_notable_examples") or {}
+    if not isinstance(notable, dict):
+        return []
+    return [ex for kind in EXAMPLE_KINDS for ex in (notable.get(kind) or []) if isinstance(ex, dict)]
+
+
+async def dehydrate_report(report: Dict[str, Any], known: Iterable[str] = ()) -> Dict[str, Any]:
+    """Normalize the notable examples' citations to source_ids only (in place).
+
+    source_ids are kept only if they are in `known` (ids the writer was given); an id
+    the model made up is dropped. source_urls (URLs the model wrote out) are interned.
+    """
+    known = set(known)
+    table: Dict[str, Dict[str, str]] = {}
+    for ex in _examples(report):
+        ids = [r for r in ex.get("source_ids") or [] if isinstance(r, str) and r in known]
+        ids += [r if r in known else intern(table, r)
+                for r in ex.pop("source_urls", None) or [] if isinstance(r, str) and r]
+        ex["source_ids"] = list(dict.fromkeys(ids))
+    if table:
+        await store(table)
+    return report
+
+
+async def hydrate_reports(reports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Add source_urls back next to source_ids (in place), one lookup for all reports."""
+    examples = [ex for r in reports if isinstance(r, dict) for ex in _examples(r)]
+    ids = {sid for ex in examples for sid in ex.get("source_ids") or []}
+    if not ids:
+        return reports
+    table = await resolve(ids)
+    for ex in examples:
+        if "source_ids" in ex:
+            ex["source_urls"] = [table[sid]["url"] for sid in ex["source_ids"] if sid in table]
+    return reports
@@ -0,0 +1,155 @@
+"""
+Small thumbnails for the history screen.
+
+Each uploaded image gets a WebP thumbnail (at most THUMBNAIL_SIDE pixels per
+side) stored next to the original in S3: images/abc.jpg -> images/abc.thumb.webp.
+/reports returns its URL as thumbnail_url; the original (image_url) is only
+fetched when a report is opened.
+
+Decoding and resizing are CPU-bound, so they run in a process pool of
+THUMBNAIL_WORKERS processes instead of the event loop or a thread. Reports from
+before thumbnails existed are filled in by backfill(), started with the API
+(THUMBNAIL_BACKFILL=0 disables it).
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from PIL import Image, features
+
+from .metrics import timed, THUMBNAILS
+
+THUMBNAIL_SIDE = int(os.getenv("THUMBNAIL_SIDE", "320"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(min(4, os.cpu_count() or 1))))
+THUMBNAIL_BACKFILL = os.getenv("THUMBNAIL_BACKFILL", "1") == "1"
+BACKFILL_BATCH_SIZE = int(os.getenv("THUMBNAIL_BACKFILL_BATCH", "50"))
+BACKFILL_THROTTLE_SECONDS = float(os.getenv("THUMBNAIL_BACKFILL_THROTTLE", "1"))
+BACKFILL_CLAIM_MINUTES = 10   # another API worker may retry a claim older than this
+
+# Pillow builds without libwebp fall back to JPEG
+FORMAT, CONTENT_TYPE, EXTENSION = (
+    ("WEBP", "image/webp", "webp") if features.check("webp") else ("JPEG", "image/jpeg", "jpg")
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def thumbnail_key(s3_key: str) -> str:
+    return f"{s3_key.rsplit('.', 1)[0]}.thumb.{EXTENSION}"
+
+
+def render(data: bytes) -> bytes:
+    """Decode (JPEG draft-mode downscaling) and encode a thumbnail. Runs in a pool process."""
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", (THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+    img = img.convert("RGB")
+    img.thumbnail((THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+    buf = io.BytesIO()
+    img.save(buf, format=FORMAT, quality=THUMBNAIL_QUALITY)
+    return buf.getvalue()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and boto3/pymongo threads is unsafe
+        _pool = ProcessPoolExecutor(THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown() -> None:
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def create(s3, bucket: str, s3_key: str, data: bytes, source: str = "upload") -> Optional[str]:
+    """Render and store the thumbnail for the image at s3_key. Returns its key, or None on failure.
+
+    `data` may be any decodable copy of the image; the downscaled vision copy is cheapest.
+    """
+    key = thumbnail_key(s3_key)
+    try:
+        with timed("thumbnail_render", bytes=len(data)):
+            thumb = await asyncio.get_running_loop().run_in_executor(_executor(), render, data)
+        with timed("thumbnail_upload", bytes=len(thumb)):
+            await asyncio.to_thread(
+                s3.put_object, Bucket=bucket, Key=key, Body=thumb,
+                ContentType=CONTENT_TYPE, CacheControl="public, max-age=31536000, immutable",
+            )
+    except Exception as e:
+        print(f"Failed to create thumbnail for {s3_key}:", e)
+        THUMBNAILS.labels(source=source, result="failed").inc()
+        return None
+    THUMBNAILS.labels(source=source, result="created").inc()
+    return key
+
+
+def _unclaimed() -> dict:
+    stale = datetime.utcnow() - timedelta(minutes=BACKFILL_CLAIM_MINUTES)
+    return {"$or": [{"thumbnail_claimed_at": {"$exists": False}}, {"thumbnail_claimed_at": {"$lt": stale}}]}
+
+
+def _claim(coll, request_id: str) -> bool:
+    """Take a report for backfilling, so several API workers do not render the same image."""
+    result = coll.update_one(
+        {"request_id": request_id, "thumbnail_key": {"$exists": False}, **_unclaimed()},
+        {"$set": {"thumbnail_claimed_at": datetime.utcnow()}},
+    )
+    return result.modified_count == 1
+
+
+def _read_object(s3, bucket: str, key: str) -> bytes:
+    return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
+async def backfill(coll, s3, bucket: str, s3_key_of) -> int:
+    """Create thumbnails for reports that have none, one throttled batch at a time.
+
+    `s3_key_of(doc)` gives the original's key (older documents only store image_url).
+    Reports whose original cannot be read or decoded are marked thumbnail_failed and skipped.
+    """
+    created = 0
+    while True:
+        query = {"thumbnail_key": {"$exists": False}, "thumbnail_failed": {"$exists": False},
+                 "image_url": {"$ne": None}, **_unclaimed()}
+        docs = await asyncio.to_thread(
+            lambda: list(coll.find(query, {"request_id": 1, "s3_key": 1, "image_url": 1}).limit(BACKFILL_BATCH_SIZE))
+        )
+        if not docs:
+            return created
+
+        async def one(doc) -> None:
+            nonlocal created
+            if not await asyncio.to_thread(_claim, coll, doc["request_id"]):
+                return
+            s3_key = s3_key_of(doc)
+            key = None
+            try:
+                data = await asyncio.to_thread(_read_object, s3, bucket, s3_key)
+                key = await create(s3, bucket, s3_key, data, source="backfill")
+            except Exception as e:
+                print(f"Failed to read {s3_key} for thumbnail backfill:", e)
+            update = {"thumbnail_key": key} if key else {"thumbnail_failed": True}
+            await asyncio.to_thread(coll.update_one, {"request_id": doc["request_id"]}, {"$set": update})
+            created += bool(key)
+
+        # As many at once as there are pool processes to render them
+        for i in range(0, len(docs), THUMBNAIL_WORKERS):
+            await asyncio.gather(*(one(d) for d in docs[i:i + THUMBNAIL_WORKERS]))
+        await asyncio.sleep(BACKFILL_THROTTLE_SECONDS)
+
+
+async def run_backfill(coll, s3, bucket: str, s3_key_of) -> None:
+    if not THUMBNAIL_BACKFILL:
+        return
+    try:
+        created = await backfill(coll, s3, bucket, s3_key_of)
+        if created:
+            print(f"Thumbnail backfill created {created} thumbnails")
+    except Exception as e:
+        print("Thumbnail backfill failed:", e)
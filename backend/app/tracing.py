@@ -0,0 +1,188 @@
+"""
+Lightweight tracing for the report pipeline (API -> detect -> deep search -> writer -> webhook).
+
+Trace context is carried as a W3C `traceparent` string ("00-<trace_id>-<span_id>-01"):
+in the `traceparent` field of the agent messages and as an HTTP header on the webhook.
+Finished spans go to the configured exporter:
+
+    TRACE_EXPORTER=none        (default) drop spans
+    TRACE_EXPORTER=jsonl       one flat JSON object per span, appended to TRACE_FILE
+    TRACE_EXPORTER=otlp-file   OTLP/JSON ResourceSpans lines, appended to TRACE_FILE
+
+Other exporters can be added with register_exporter().
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "cruzhack")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]):
+    """Return (trace_id, parent_span_id) or (None, None) if missing/invalid."""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def current_traceparent() -> Optional[str]:
+    span_ = _current.get()
+    return span_.traceparent if span_ else None
+
+
+def annotate(**attributes) -> None:
+    """Add attributes to the current span, if any."""
+    span_ = _current.get()
+    if span_ is not None:
+        span_.attributes.update(attributes)
+
+
+# ============================================================================
+# Exporters
+# ============================================================================
+
+class NullExporter:
+    def export(self, span_: Span) -> None:
+        pass
+
+
+class JsonlFileExporter:
+    """Appends one JSON object per finished span."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, span_: Span) -> Dict[str, Any]:
+        return {
+            "service": SERVICE_NAME,
+            "name": span_.name,
+            "trace_id": span_.trace_id,
+            "span_id": span_.span_id,
+            "parent_id": span_.parent_id,
+            "start_ns": span_.start_ns,
+            "end_ns": span_.end_ns,
+            "duration_ms": round((span_.end_ns - span_.start_ns) / 1e6, 3),
+            "status": span_.status,
+            "error": span_.error,
+            "attributes": span_.attributes,
+        }
+
+    def export(self, span_: Span) -> None:
+        line = json.dumps(self._record(span_), default=str)
+        with self._lock, open(self.path, "a", encoding="utf8") as f:
+            f.write(line + "\n")
+
+
+class OtlpFileExporter(JsonlFileExporter):
+    """Appends OTLP/JSON ResourceSpans, one per line (readable by the OTel collector file receiver)."""
+
+    def _record(self, span_: Span) -> Dict[str, Any]:
+        otlp_span = {
+            "traceId": span_.trace_id,
+            "spanId": span_.span_id,
+            "name": span_.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span_.start_ns),
+            "endTimeUnixNano": str(span_.end_ns),
+            "attributes": [
+                {"key": k, "value": {"stringValue": str(v)}} for k, v in span_.attributes.items()
+            ],
+            "status": {"code": 2, "message": span_.error} if span_.status == "error" else {"code": 1},
+        }
+        if span_.parent_id:
+            otlp_span["parentSpanId"] = span_.parent_id
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [otlp_span]}],
+            }]
+        }
+
+
+_EXPORTERS: Dict[str, Callable[[], Any]] = {
+    "none": NullExporter,
+    "jsonl": lambda: JsonlFileExporter(TRACE_FILE),
+    "otlp-file": lambda: OtlpFileExporter(TRACE_FILE),
+}
+
+
+def register_exporter(name: str, factory: Callable[[], Any]) -> None:
+    _EXPORTERS[name] = factory
+
+
+_exporter: Any = None
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        _exporter = _EXPORTERS.get(os.getenv("TRACE_EXPORTER", "none"), NullExporter)()
+    return _exporter
+
+
+def set_exporter(exporter) -> None:
+    global _exporter
+    _exporter = exporter
+
+
+# ============================================================================
+# Spans
+# ============================================================================
+
+@contextmanager
+def span(name: str, parent: Optional[str] = None, **attributes):
+    """Open a span as a child of `parent` (a traceparent string) or of the current span."""
+    trace_id, parent_id = parse_traceparent(parent)
+    if trace_id is None:
+        current = _current.get()
+        if current is not None:
+            trace_id, parent_id = current.trace_id, current.span_id
+        else:
+            trace_id = secrets.token_hex(16)
+
+    span_ = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.status = "error"
+        span_.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        span_.end_ns = time.time_ns()
+        try:
+            get_exporter().export(span_)
+        except Exception as e:
+            print("Failed to export span:", e)
@@ -0,0 +1,164 @@
+"""
+Direct-to-S3 uploads.
+
+The client asks for a presigned POST (or a multipart upload for large files),
+sends the image straight to S3, then calls /report-json/from-s3 with the key.
+The API only streams the object back into a bounded spool file and hands the
+vision model a downscaled JPEG, so its memory use does not grow with image size.
+
+Uploads that do come through the API (/report-json) use the same spool:
+spool_upload() reads the body in chunks, enforcing MAX_UPLOAD_BYTES and hashing
+as it goes; the spool then feeds the S3 (multipart) upload and the vision
+preprocessor in turn, without another in-memory copy.
+"""
+import hashlib
+import io
+import math
+import os
+import tempfile
+import uuid
+
+from boto3.s3.transfer import TransferConfig
+from typing import Any, Dict, List, Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MULTIPART_THRESHOLD = int(os.getenv("MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+MULTIPART_PART_SIZE = int(os.getenv("MULTIPART_PART_SIZE", str(8 * 1024 * 1024)))
+PRESIGN_EXPIRES = int(os.getenv("PRESIGN_EXPIRES", "600"))
+SPOOL_MEMORY_LIMIT = int(os.getenv("SPOOL_MEMORY_LIMIT", str(2 * 1024 * 1024)))
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "2048"))
+READ_CHUNK = 1024 * 1024
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_PART_SIZE,
+)
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/heic": "heic"}
+
+
+def user_prefix(user_id: str) -> str:
+    """Per-user key prefix; a user can only submit keys under their own prefix."""
+    return f"uploads/{hashlib.sha256(user_id.encode()).hexdigest()[:16]}/"
+
+
+def presign_upload(s3, bucket: str, user_id: str, content_type: str, size: int) -> Dict[str, Any]:
+    if not content_type.startswith("image/"):
+        raise HTTPException(400, "Upload must be an image")
+    if size <= 0 or size > MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"Image must be between 1 byte and {MAX_UPLOAD_BYTES} bytes")
+
+    key = f"{user_prefix(user_id)}{uuid.uuid4().hex}.{EXTENSIONS.get(content_type, 'img')}"
+
+    if size <= MULTIPART_THRESHOLD:
+        post = s3.generate_presigned_post(
+            Bucket=bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, MAX_UPLOAD_BYTES],
+            ],
+            ExpiresIn=PRESIGN_EXPIRES,
+        )
+        return {"method": "POST", "key": key, "url": post["url"], "fields": post["fields"]}
+
+    # Large files: presigned PUT per part; the size cap is re-checked with HEAD before detection
+    upload = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+    parts = math.ceil(size / MULTIPART_PART_SIZE)
+    part_urls = [
+        s3.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": bucket, "Key": key, "UploadId": upload["UploadId"], "PartNumber": n},
+            ExpiresIn=PRESIGN_EXPIRES,
+        )
+        for n in range(1, parts + 1)
+    ]
+    return {
+        "method": "MULTIPART",
+        "key": key,
+        "upload_id": upload["UploadId"],
+        "part_size": MULTIPART_PART_SIZE,
+        "part_urls": part_urls,
+    }
+
+
+def complete_multipart(s3, bucket: str, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> None:
+    s3.complete_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": sorted(
+            ({"ETag": p["ETag"], "PartNumber": int(p["PartNumber"])} for p in parts),
+            key=lambda p: p["PartNumber"],
+        )},
+    )
+
+
+def fetch_object(s3, bucket: str, key: str) -> Tuple[tempfile.SpooledTemporaryFile, str, int]:
+    """Stream an uploaded object into a spool file (memory up to SPOOL_MEMORY_LIMIT, then disk)."""
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except Exception:
+        raise HTTPException(404, "Uploaded object not found")
+    size = head["ContentLength"]
+    content_type = head.get("ContentType") or ""
+    if not content_type.startswith("image/"):
+        raise HTTPException(400, "Upload must be an image")
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"Image larger than {MAX_UPLOAD_BYTES} bytes")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    for chunk in body.iter_chunks(READ_CHUNK):
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, content_type, size
+
+
+async def spool_upload(upload: UploadFile) -> Tuple[tempfile.SpooledTemporaryFile, int, str]:
+    """Read an upload in chunks into a spool file. Returns (spool, size, sha256 hex); 413 past MAX_UPLOAD_BYTES."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await upload.read(READ_CHUNK):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(413, f"Image larger than {MAX_UPLOAD_BYTES} bytes")
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    if size == 0:
+        spool.close()
+        raise HTTPException(400, "Empty upload")
+    spool.seek(0)
+    return spool, size, digest.hexdigest()
+
+
+def upload_spool(s3, bucket: str, key: str, spool, content_type: str) -> None:
+    """Upload from the spool (multipart above MULTIPART_THRESHOLD) and rewind it for the next reader."""
+    spool.seek(0)
+    s3.upload_fileobj(spool, bucket, key, ExtraArgs={"ContentType": content_type}, Config=TRANSFER_CONFIG)
+    spool.seek(0)
+
+
+def prepare_for_vision(fileobj) -> bytes:
+    """Decode (with JPEG draft-mode downscaling) and re-encode at most VISION_MAX_SIDE pixels per side."""
+    try:
+        img = Image.open(fileobj)
+        img.draft("RGB", (VISION_MAX_SIDE, VISION_MAX_SIDE))
+        img = img.convert("RGB")
+        img.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=90)
+        return buf.getvalue()
+    except Exception:
+        # Not decodable by PIL (e.g. HEIC without a plugin): hand Gemini the original bytes
+        fileobj.seek(0)
+        return fileobj.read()
@@ -0,0 +1,17 @@
+import pytest
+
+from app.agents import clean_evidence, normalize_sources
+
+from data import PRODUCT_DETECTION, answers, raw_citations
+
+
+@pytest.mark.parametrize("n_answers", [5, 20, 80, 320])
+def bench_clean_evidence(benchmark, n_answers):
+    results = answers(n_answers)
+    benchmark(clean_evidence, PRODUCT_DETECTION, results)
+
+
+@pytest.mark.parametrize("n_sources", [10, 100, 1000])
+def bench_normalize_sources(benchmark, n_sources):
+    raw = raw_citations(n_sources)
+    benchmark(normalize_sources, raw)
@@ -0,0 +1,10 @@
+import pytest
+
+from app.DetectService import CANON_PRODUCT_TYPES, best_match
+
+TOKENS = ["Energy Drink", "shampoo & conditioner", "Baby Formula Powder", "dish soap", "unknown widget"]
+
+
+@pytest.mark.parametrize("token", TOKENS)
+def bench_best_match(benchmark, token):
+    benchmark(best_match, token, CANON_PRODUCT_TYPES)
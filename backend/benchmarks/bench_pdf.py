@@ -0,0 +1,16 @@
+import pytest
+
+from app.json_to_pdf import _norm, json_to_pdf
+
+from data import FINAL_REPORT
+
+
+@pytest.mark.parametrize("length", [80, 2000])
+def bench_norm(benchmark, length):
+    text = ("Caffeine – taurine × guarana\n  blend   " * (length // 40 + 1))[:length]
+    benchmark(_norm, text)
+
+
+def bench_json_to_pdf(benchmark, tmp_path):
+    out = str(tmp_path / "report.pdf")
+    benchmark(json_to_pdf, FINAL_REPORT, out)
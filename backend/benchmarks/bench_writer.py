@@ -0,0 +1,13 @@
+import json
+
+from app.agent_function import clean_json_response
+
+from data import WRITER_OUTPUT
+
+
+def bench_clean_json_response(benchmark):
+    benchmark(clean_json_response, WRITER_OUTPUT)
+
+
+def bench_parse_writer_output(benchmark):
+    benchmark(lambda: json.loads(clean_json_response(WRITER_OUTPUT)))
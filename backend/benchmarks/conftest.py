@@ -0,0 +1,11 @@
+"""
+Micro-benchmarks for the CPU-bound hot paths (pytest-benchmark).
+
+The app modules read API keys and connect to Mongo at import time; the
+benchmarks never call out, so dummy values are enough.
+"""
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.setdefault("uri", "mongodb://127.0.0.1:27017/?serverSelectionTimeoutMS=200")
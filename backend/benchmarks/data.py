@@ -0,0 +1,107 @@
+"""Deterministic, realistic inputs for the benchmarks."""
+import json
+import random
+
+PRODUCT_DETECTION = {
+    "product": {
+        "product_name": "MEGA MONSTER ENERGY",
+        "brand": "MONSTER",
+        "manufacturer_or_company": "Monster Beverage Corporation",
+        "category": "Energy Drink",
+    },
+    "research_queries": [
+        "MONSTER MEGA MONSTER ENERGY lawsuit",
+        "MEGA MONSTER ENERGY ingredients complaint",
+        "Monster Energy drink recall",
+        "Monster Energy warnings",
+        "Monster Energy adverse events",
+    ],
+    "evidence": {"product_name_text": "MEGA MONSTER ENERGY", "brand_text": "MONSTER"},
+    "confidence": 0.5,
+}
+
+_SENTENCES = [
+    "In 2012 the FDA received adverse event reports that mentioned the product.",
+    "A class action lawsuit alleged the company failed to warn consumers about caffeine levels.",
+    "The company announced a voluntary recall of several lots due to a packaging defect.",
+    "Health Canada issued an advisory about high caffeine intake for children.",
+    "Consumers are advised to use caution and not exceed the recommended daily amount.",
+    "The litigation was settled in 2016 without admission of wrongdoing.",
+    "No recalls were found for this specific product in the FDA enforcement database.",
+    "Several news outlets reported on the lawsuit filed by the family of a teenager.",
+]
+
+
+def answers(n: int, seed: int = 0):
+    """n Perplexity-style (answer, sources) pairs, with some near-duplicates like real runs."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        text = " ".join(rng.sample(_SENTENCES, k=rng.randint(3, 6)))
+        sources = [
+            {"url": f"https://www.fda.gov/safety/recalls/{rng.randint(1, 50)}", "title": f"FDA notice {i}"}
+            for _ in range(rng.randint(2, 6))
+        ]
+        out.append((text, sources))
+    return out
+
+
+def raw_citations(n: int, seed: int = 0):
+    """Mixed citation shapes as returned by Perplexity (mostly URL strings)."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.8:
+            out.append(f"https://news.example.com/story/{i}?utm_source=perplexity")
+        elif roll < 0.95:
+            out.append({"url": f"https://www.fda.gov/{i}", "title": "FDA"})
+        else:
+            out.append(i)
+    return out
+
+
+FINAL_REPORT = {
+    "title": "Risk Summary: MEGA MONSTER ENERGY",
+    "subtitle": {"category": "Energy Drink", "timeframe_reviewed": "2012–2024"},
+    "executive_summary": {
+        "bullets": [
+            "Total findings reviewed: 3 lawsuits, 1 recalls, 4 warnings",
+            "Primary risk themes: caffeine-related adverse events; labeling adequacy",
+            "Most material exposure area: legal",
+            "Overall risk level: Medium",
+        ],
+        "overall_risk_level": "Medium",
+        "totals": {"lawsuits": 3, "recalls": 1, "warnings": 4},
+        "primary_risk_themes": ["caffeine adverse events", "labeling"],
+        "most_material_exposure_area": "legal",
+    },
+    "findings_overview_table": [
+        {"category": "Lawsuits", "count": 3, "key_issues_themes_only": ["failure to warn", "wrongful death"], "timeframe": "2012–2016"},
+        {"category": "Recalls", "count": 1, "key_issues_themes_only": ["packaging defect"], "timeframe": "2019"},
+        {"category": "Warnings", "count": 4, "key_issues_themes_only": ["caffeine × children", "advisories"], "timeframe": "2012–2024"},
+    ],
+    "key_notable_examples": {
+        "lawsuits": [
+            {"bullet": "Wrongful death suit alleging failure to warn", "status": "settled", "source_urls": ["https://example.com/1"]},
+            {"bullet": "Class action on labeling claims", "status": "dismissed", "source_urls": ["https://example.com/2"]},
+        ],
+        "recalls": [{"bullet": "Voluntary recall for packaging defect", "scope": "limited lots", "source_urls": ["https://example.com/3"]}],
+        "warnings": [{"bullet": "Health Canada caffeine advisory", "source_urls": ["https://example.com/4"]}],
+    },
+    "risk_implications": {"bullets": [
+        "High caffeine content can cause heart palpitations and elevated blood pressure",
+        "Taurine and guarana combined with caffeine may amplify stimulant effects",
+    ]},
+    "recommendations": {"bullets": [
+        "Limit intake to one can per day; avoid for children and pregnant people",
+        "Do not combine with alcohol",
+    ]},
+    "footer": {
+        "methodology_line": "Methodology: Publicly available lawsuits, recall databases, and regulatory warnings reviewed via deep search.",
+        "disclaimer_line": "Disclaimer: Informational summary only; not legal advice.",
+    },
+}
+
+# What the writer model typically returns: pretty-printed JSON wrapped in a markdown fence
+WRITER_OUTPUT = "```json\n" + json.dumps(FINAL_REPORT, indent=2) + "\n```"
@@ -0,0 +1,256 @@
+"""
+Local stand-ins for every upstream the report pipeline calls.
+
+One FastAPI app serves:
+    POST /v1beta/models/{model}:generateContent   Gemini (REST transport)
+    POST /chat/completions                        Perplexity
+    POST /openai/v1/chat/completions              Groq
+    PUT/GET/HEAD/DELETE /{bucket}/{key}           S3 (path-style, objects kept in memory)
+    POST /{bucket}                                S3 presigned POST upload and ?delete (delete_objects)
+    POST /{bucket}/{key}?uploads|?uploadId=       S3 multipart create / complete
+
+Latency and errors are configured per upstream with environment variables:
+    FAKE_GEMINI_LATENCY=lognormal:2.0:0.4     (median seconds, sigma)
+    FAKE_PERPLEXITY_LATENCY=uniform:1:4       (min, max seconds)
+    FAKE_GROQ_LATENCY=const:6
+    FAKE_S3_LATENCY=const:0.05
+    FAKE_<UPSTREAM>_ERROR_RATE=0.02           (fraction answered with FAKE_<UPSTREAM>_ERROR_STATUS, default 500)
+    FAKE_<UPSTREAM>_HANG_RATE=0.01            (fraction that sleep for FAKE_HANG_SECONDS before answering)
+    FAKE_S3_MAX_OBJECTS=10000                 (oldest objects are evicted beyond this)
+
+Run: uvicorn loadtest.fakes:app --port 9000   (from backend/)
+"""
+import asyncio
+import json
+import os
+import random
+import uuid
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake upstreams")
+
+DEFAULT_LATENCY = {
+    "gemini": "lognormal:2.0:0.4",
+    "perplexity": "lognormal:2.5:0.5",
+    "groq": "lognormal:5.0:0.3",
+    "s3": "const:0.05",
+}
+HANG_SECONDS = float(os.getenv("FAKE_HANG_SECONDS", "30"))
+
+
+def _sample_latency(upstream: str) -> float:
+    spec = os.getenv(f"FAKE_{upstream.upper()}_LATENCY", DEFAULT_LATENCY[upstream])
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "const":
+        return params[0]
+    if kind == "uniform":
+        return random.uniform(params[0], params[1])
+    if kind == "lognormal":
+        median, sigma = params
+        return random.lognormvariate(0, sigma) * median
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+async def _behave(upstream: str):
+    """Sleep like the real upstream would; return an error response if this call should fail."""
+    delay = _sample_latency(upstream)
+    if random.random() < float(os.getenv(f"FAKE_{upstream.upper()}_HANG_RATE", "0")):
+        delay = HANG_SECONDS
+    await asyncio.sleep(delay)
+    if random.random() < float(os.getenv(f"FAKE_{upstream.upper()}_ERROR_RATE", "0")):
+        status = int(os.getenv(f"FAKE_{upstream.upper()}_ERROR_STATUS", "500"))
+        return JSONResponse({"error": {"message": f"fake {upstream} failure", "type": "fake_error"}}, status_code=status)
+    return None
+
+
+# ============================================================================
+# Canned payloads
+# ============================================================================
+
+BRANDS = ["MONSTER", "RED BULL", "DOVE", "TIDE", "CHEERIOS", "COLGATE", "PURINA", "GERBER"]
+
+
+def _detection_json() -> dict:
+    brand = random.choice(BRANDS)
+    product = f"{brand.title()} Product {random.randint(1, 40)}"
+    return {
+        "product_name": product,
+        "brand": brand,
+        "manufacturer_or_company": f"{brand.title()} Inc.",
+        "category": "beverage",
+        "research_queries": [
+            f"{brand} {product} lawsuit",
+            f"{brand} recall",
+            f"{product} ingredients complaint",
+            f"{brand} warnings",
+        ],
+        "evidence": {"product_name_text": product, "brand_text": brand},
+    }
+
+
+ANSWER = (
+    "In 2022 the company announced a voluntary recall of several lots after a packaging defect. "
+    "A class action lawsuit filed in 2021 alleged misleading labeling and was settled. "
+    "The FDA issued a warning letter and consumers were advised to use caution with high caffeine intake."
+)
+
+FINAL_REPORT = {
+    "title": "Risk Summary: Fake Product",
+    "subtitle": {"category": "Beverage", "timeframe_reviewed": "2019-2024"},
+    "executive_summary": {
+        "bullets": ["Total findings reviewed: 1 lawsuits, 1 recalls, 1 warnings", "Labeling and packaging themes"],
+        "overall_risk_level": "Medium",
+        "totals": {"lawsuits": 1, "recalls": 1, "warnings": 1},
+        "primary_risk_themes": ["labeling"],
+        "most_material_exposure_area": "regulatory",
+    },
+    "findings_overview_table": [
+        {"category": "Lawsuits", "count": 1, "key_issues_themes_only": ["labeling"], "timeframe": "2021"},
+        {"category": "Recalls", "count": 1, "key_issues_themes_only": ["packaging"], "timeframe": "2022"},
+        {"category": "Warnings", "count": 1, "key_issues_themes_only": ["caffeine"], "timeframe": "2023"},
+    ],
+    "key_notable_examples": {
+        "lawsuits": [{"bullet": "Labeling class action", "status": "settled", "source_urls": ["https://example.com/a"]}],
+        "recalls": [{"bullet": "Packaging defect recall", "scope": "several lots", "source_urls": ["https://example.com/b"]}],
+        "warnings": [{"bullet": "FDA warning letter", "source_urls": ["https://example.com/c"]}],
+    },
+    "risk_implications": {"bullets": ["High caffeine intake can cause heart palpitations"]},
+    "recommendations": {"bullets": ["Limit consumption to one can per day"]},
+    "footer": {
+        "methodology_line": "Methodology: Publicly available lawsuits, recall databases, and regulatory warnings reviewed via deep search.",
+        "disclaimer_line": "Disclaimer: Informational summary only; not legal advice.",
+    },
+}
+
+
+def _chat_completion(content: str, **extra) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "fake",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 100, "total_tokens": 200},
+        **extra,
+    }
+
+
+# ============================================================================
+# Routes
+# ============================================================================
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def gemini_generate(model: str):
+    error = await _behave("gemini")
+    if error:
+        return error
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": json.dumps(_detection_json())}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }]
+    }
+
+
+@app.post("/chat/completions")
+async def perplexity_chat(request: Request):
+    error = await _behave("perplexity")
+    if error:
+        return error
+    n = random.randint(2, 6)
+    citations = [f"https://news.example.com/story/{random.randint(1, 500)}?utm_source=fake" for _ in range(n)]
+    return _chat_completion(ANSWER, citations=citations)
+
+
+@app.post("/openai/v1/chat/completions")
+async def groq_chat(request: Request):
+    error = await _behave("groq")
+    if error:
+        return error
+    return _chat_completion(json.dumps(FINAL_REPORT))
+
+
+# (bucket, key) -> (body, content type), so GETs (from-s3, thumbnail backfill) see real bytes
+S3_OBJECTS: "OrderedDict[Tuple[str, str], Tuple[bytes, str]]" = OrderedDict()
+S3_MULTIPART: Dict[str, Dict[int, bytes]] = {}
+S3_MAX_OBJECTS = int(os.getenv("FAKE_S3_MAX_OBJECTS", "10000"))
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+def _s3_put(bucket: str, key: str, body: bytes, content_type: str) -> str:
+    S3_OBJECTS[(bucket, key)] = (body, content_type or "application/octet-stream")
+    S3_OBJECTS.move_to_end((bucket, key))
+    while len(S3_OBJECTS) > S3_MAX_OBJECTS:
+        S3_OBJECTS.popitem(last=False)
+    return f'"{uuid.uuid4().hex}"'
+
+
+def _xml(body: str, status_code: int = 200) -> Response:
+    return Response(f'<?xml version="1.0" encoding="UTF-8"?>{body}', status_code=status_code, media_type="application/xml")
+
+
+@app.post("/{bucket}")
+async def s3_bucket_post(bucket: str, request: Request):
+    error = await _behave("s3")
+    if error:
+        return error
+    if "delete" in request.query_params:
+        # delete_objects; answered as Quiet (errors only, and there are none)
+        root = ET.fromstring(await request.body())
+        for key in root.iter(f"{{{S3_NS}}}Key"):
+            S3_OBJECTS.pop((bucket, key.text), None)
+        return _xml(f'<DeleteResult xmlns="{S3_NS}"></DeleteResult>')
+    # Presigned POST form upload
+    form = await request.form()
+    upload = form["file"]
+    _s3_put(bucket, form["key"], await upload.read(), form.get("Content-Type", ""))
+    return Response(status_code=204)
+
+
+@app.api_route("/{bucket}/{key:path}", methods=["PUT", "POST", "GET", "HEAD", "DELETE"])
+async def s3_object(bucket: str, key: str, request: Request):
+    error = await _behave("s3")
+    if error:
+        return error
+    params = request.query_params
+    body = await request.body()
+
+    if request.method == "POST" and "uploads" in params:
+        upload_id = uuid.uuid4().hex
+        S3_MULTIPART[upload_id] = {}
+        return _xml(f'<InitiateMultipartUploadResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket>'
+                    f'<Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+    if request.method == "PUT" and "uploadId" in params:
+        S3_MULTIPART.setdefault(params["uploadId"], {})[int(params["partNumber"])] = body
+        return Response(status_code=200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+    if request.method == "POST" and "uploadId" in params:
+        parts = S3_MULTIPART.pop(params["uploadId"], {})
+        etag = _s3_put(bucket, key, b"".join(parts[n] for n in sorted(parts)), "")
+        return _xml(f'<CompleteMultipartUploadResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket>'
+                    f'<Key>{key}</Key><ETag>{etag}</ETag></CompleteMultipartUploadResult>')
+
+    if request.method == "DELETE":
+        if "uploadId" in params:
+            S3_MULTIPART.pop(params["uploadId"], None)
+        else:
+            S3_OBJECTS.pop((bucket, key), None)
+        return Response(status_code=204)
+    if request.method in ("GET", "HEAD"):
+        obj = S3_OBJECTS.get((bucket, key))
+        if obj is None:
+            return _xml(f"<Error><Code>NoSuchKey</Code><Key>{key}</Key></Error>", 404) if request.method == "GET" \
+                else Response(status_code=404)
+        data, content_type = obj
+        headers = {"ETag": '"fake"', "Content-Length": str(len(data))}
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=headers, media_type=content_type)
+        return Response(data, headers=headers, media_type=content_type)
+    etag = _s3_put(bucket, key, body, request.headers.get("content-type", ""))
+    return Response(status_code=200, headers={"ETag": etag})
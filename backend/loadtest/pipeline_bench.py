@@ -0,0 +1,71 @@
+"""
+Whole-pipeline benchmark: detection + deep search + writer, in-process, for a folder of images.
+
+Record once against the real upstreams, then replay offline as often as needed:
+
+    cd backend
+    CASSETTE_MODE=record python -m loadtest.pipeline_bench --images samples/
+    CASSETTE_MODE=replay CASSETTE_LATENCY_SCALE=0 python -m loadtest.pipeline_bench --images samples/ --repeat 5
+
+With CASSETTE_LATENCY_SCALE=1 replay reproduces the recorded upstream latencies;
+with 0 it measures only our own overhead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+
+from app.agents import DetectionInput, run_pipeline
+from app.DetectService import detect_ingredients
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+async def _one(image_bytes: bytes) -> dict:
+    timings: dict = {}
+    start = time.perf_counter()
+    detection = await detect_ingredients(image_bytes)
+    timings["gemini_detect"] = round(time.perf_counter() - start, 4)
+    message = DetectionInput(
+        detection_result=detection.model_dump(),
+        request_id=uuid.uuid4().hex,
+        callback_url="http://127.0.0.1/unused",
+    )
+    await run_pipeline(message, timings=timings)
+    timings["total"] = round(time.perf_counter() - start, 4)
+    return timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="folder of product photos")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--out", help="write per-run timings as JSON")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    runs = []
+    for _ in range(args.repeat):
+        for path in paths:
+            with open(path, "rb") as f:
+                timings = await _one(f.read())
+            runs.append({"image": os.path.basename(path), **timings})
+            print(f"{os.path.basename(path):<30} total={timings['total']:.3f}s")
+
+    totals = [r["total"] for r in runs]
+    if totals:
+        print(f"runs={len(totals)} mean={statistics.fmean(totals):.3f}s "
+              f"median={statistics.median(totals):.3f}s max={max(totals):.3f}s")
+    if args.out:
+        with open(args.out, "w", encoding="utf8") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
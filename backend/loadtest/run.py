@@ -0,0 +1,217 @@
+"""
+Load test for /report-json (or the presigned upload path: /uploads/presign,
+a POST straight to the fake S3, then /report-json/from-s3).
+
+Starts the fake upstreams, the Bureau and the real FastAPI app (unless --no-spawn),
+then ramps concurrency and reports latency percentiles and throughput per level.
+
+    cd backend
+    python -m loadtest.run --concurrency 1,4,16,32 --requests 50 --out loadtest_results.json
+
+Mongo is not faked: point `uri` at a local mongod (the default below) or any
+throwaway deployment. Use FAKE_* variables (see loadtest/fakes.py) to shape the
+upstream latency and error distributions. The fake detections cover only a few
+hundred products, so the report cache and its warmer are off unless --cache is
+given; otherwise a long run mostly measures cache hits. Likewise the upstream
+scheduler's token buckets (SCHEDULER_*_RATE) are lifted unless --scheduler is
+given, so latency reflects the app rather than the local Groq/Perplexity quota queue.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPSTREAMS = ("GEMINI", "PERPLEXITY", "GROQ")
+
+
+def _service_env(fakes_url: str, pipeline_mode: str, cache: bool = False,
+                 scheduler: bool = False) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "fake",
+        "GEMINI_API_ENDPOINT": fakes_url,
+        "PREPLEXITY_API_KEY": "fake",
+        "PERPLEXITY_API_URL": f"{fakes_url}/chat/completions",
+        "GROQ_API_KEY": "fake",
+        "GROQ_BASE_URL": fakes_url,
+        "AWS_ACCESS_KEY_ID": "fake",
+        "AWS_SECRET_ACCESS_KEY": "fake",
+        "AWS_S3_BUCKET": "loadtest",
+        "AWS_ENDPOINT_URL": fakes_url,
+        "MONGO_DB": env.get("MONGO_DB", "cruzhack_loadtest"),
+        "uri": env.get("uri", "mongodb://127.0.0.1:27017"),
+        "PIPELINE_MODE": pipeline_mode,
+        "PUBLIC_BASE_URL": "http://127.0.0.1:8080",
+        # One fake user sends everything; don't let the per-user bucket cap the test
+        "ADMISSION_USER_RATE": env.get("ADMISSION_USER_RATE", "100000"),
+        "ADMISSION_USER_BURST": env.get("ADMISSION_USER_BURST", "100000"),
+    })
+    if not cache:
+        env.update({"REPORT_CACHE_TTL_HOURS": "0", "WARM_HOURS": ""})
+    if not scheduler:
+        # 0 = unlimited; an explicit SCHEDULER_*_RATE in the environment still wins
+        env.update({f"SCHEDULER_{u}_RATE": env.get(f"SCHEDULER_{u}_RATE", "0") for u in UPSTREAMS})
+    return env
+
+
+def _limits(env: Dict[str, str]) -> Dict[str, str]:
+    """The rate limits the spawned services run with ("default" = the app's built-in value)."""
+    names = ["ADMISSION_USER_RATE", "ADMISSION_USER_BURST", "ADMISSION_MAX_IN_FLIGHT"]
+    names += [f"SCHEDULER_{u}_{kind}" for u in UPSTREAMS for kind in ("RATE", "BURST")]
+    return {name: env.get(name, "default") for name in names}
+
+
+def _spawn(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env=env)
+
+
+async def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def _unique_image() -> bytes:
+    # Random pixels so identical-upload coalescing never merges load-test requests
+    img = Image.new("RGB", (64, 64), tuple(random.randint(0, 255) for _ in range(3)))
+    img.putpixel((random.randint(0, 63), random.randint(0, 63)), (random.randint(0, 255), 0, 0))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+async def _post_report(client: httpx.AsyncClient, api_url: str, endpoint: str) -> httpx.Response:
+    image = _unique_image()
+    if endpoint == "report-json":
+        return await client.post(f"{api_url}/report-json", files={"image": ("shelf.jpg", image, "image/jpeg")})
+    r = await client.post(f"{api_url}/uploads/presign", json={"content_type": "image/jpeg", "size": len(image)})
+    if r.status_code != 200:
+        return r
+    upload = r.json()
+    r = await client.post(upload["url"], data=upload["fields"], files={"file": ("shelf.jpg", image, "image/jpeg")})
+    if r.status_code >= 300:
+        return r
+    return await client.post(f"{api_url}/report-json/from-s3", json={"key": upload["key"]})
+
+
+async def _run_level(api_url: str, concurrency: int, total: int, timeout: float,
+                     endpoint: str = "report-json") -> Dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = total
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                r = await _post_report(client, api_url, endpoint)
+                status = str(r.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "statuses": statuses,
+        "rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "p50": round(_percentile(latencies, 50), 3),
+        "p95": round(_percentile(latencies, 95), 3),
+        "p99": round(_percentile(latencies, 99), 3),
+        "mean": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "wall_seconds": round(wall, 3),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:8080")
+    parser.add_argument("--fakes-port", type=int, default=9000)
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--requests", type=int, default=40, help="requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--pipeline-mode", choices=["bureau", "inprocess"], default="bureau")
+    parser.add_argument("--endpoint", choices=["report-json", "from-s3"], default="report-json")
+    parser.add_argument("--cache", action="store_true", help="keep the report cache and warmer enabled")
+    parser.add_argument("--scheduler", action="store_true",
+                        help="keep the upstream scheduler's rate limits (SCHEDULER_*_RATE)")
+    parser.add_argument("--no-spawn", action="store_true", help="services are already running")
+    parser.add_argument("--out", help="write results as JSON")
+    args = parser.parse_args()
+
+    procs: List[subprocess.Popen] = []
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    env = _service_env(fakes_url, args.pipeline_mode, args.cache, args.scheduler)
+    # With --no-spawn the services were started elsewhere; report what this environment says
+    limits = _limits(env if not args.no_spawn else dict(os.environ))
+    print("limits:", " ".join(f"{k}={v}" for k, v in limits.items()))
+    if not args.no_spawn:
+        py = sys.executable
+        procs.append(_spawn([py, "-m", "uvicorn", "loadtest.fakes:app", "--port", str(args.fakes_port),
+                             "--log-level", "warning"], env))
+        await _wait_ready(f"{fakes_url}/docs")
+        if args.pipeline_mode == "bureau":
+            procs.append(_spawn([py, "-m", "app.agents"], env))
+        procs.append(_spawn([py, "-m", "uvicorn", "app.main:app", "--port", args.api.rsplit(":", 1)[-1],
+                             "--log-level", "warning"], env))
+        await _wait_ready(f"{args.api}/metrics")
+
+    results = []
+    try:
+        print(f"{'conc':>5} {'ok':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  statuses")
+        for level in [int(c) for c in args.concurrency.split(",")]:
+            res = await _run_level(args.api, level, args.requests, args.timeout, args.endpoint)
+            results.append(res)
+            print(f"{res['concurrency']:>5} {res['ok']:>5} {res['rps']:>8} {res['p50']:>8} "
+                  f"{res['p95']:>8} {res['p99']:>8}  {res['statuses']}")
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf8") as f:
+            json.dump({"pipeline_mode": args.pipeline_mode, "endpoint": args.endpoint, "cache": args.cache,
+                       "limits": limits, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,11 @@
+"""
+Unit tests for logic that needs no upstream or database.
+
+As in benchmarks/, the app modules read API keys and connect to Mongo at import
+time; nothing here calls out, so dummy values are enough.
+"""
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("uri", "mongodb://127.0.0.1:27017/?serverSelectionTimeoutMS=200")
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import admission as admission_module
+from app.admission import AdmissionController, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _controller(**kw):
+    settings = dict(max_in_flight=1, max_queue=1, queue_timeout=5, user_rate=0.5, user_burst=2,
+                    batch_rate=0.1, batch_burst=50)
+    settings.update(kw)
+    return AdmissionController(**settings)
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=0.5, capacity=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() == pytest.approx(2.0)
+    clock[0] += 2
+    assert bucket.take() == 0
+
+
+def test_user_over_burst_gets_429_with_retry_after(clock):
+    controller = _controller()
+    controller.check_rate("alice")
+    controller.check_rate("alice")
+    with pytest.raises(HTTPException) as exc:
+        controller.check_rate("alice")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "2"
+    controller.check_rate("bob")   # buckets are per user
+
+
+def test_batches_have_their_own_allowance(clock):
+    controller = _controller()
+    controller.check_rate("alice")
+    controller.check_rate("alice")
+    controller.check_batch_rate("alice", 50)   # a full shelf, despite the spent report bucket
+    with pytest.raises(HTTPException) as exc:
+        controller.check_batch_rate("alice", 1)
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "10"
+    with pytest.raises(HTTPException) as exc:
+        controller.check_batch_rate("bob", 51)
+    assert exc.value.status_code == 400
+
+
+def test_full_queue_is_rejected_without_waiting():
+    async def scenario():
+        controller = _controller()
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            async with controller.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, queued)
+        return exc.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert "Retry-After" in error.headers
+
+
+def test_queue_timeout_is_429_and_frees_the_queue():
+    async def scenario():
+        controller = _controller(queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            async with controller.slot():
+                pass
+        assert controller._waiting == 0
+        release.set()
+        await holder
+        async with controller.slot():   # the slot is free again
+            pass
+        return exc.value
+
+    assert asyncio.run(scenario()).status_code == 429
@@ -0,0 +1,74 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app import agent_registry
+from app.agent_registry import _by_hash, _least_outstanding, _sent_since_heartbeat
+
+
+def _members(n):
+    return [{"address": f"agent{i}", "in_flight": 0} for i in range(n)]
+
+
+def test_hashing_is_stable():
+    members = _members(4)
+    assert all(_by_hash(members, f"req{k}") == _by_hash(members, f"req{k}") for k in range(100))
+
+
+def test_hashing_spreads_keys():
+    counts = Counter(_by_hash(_members(4), f"req{k}")["address"] for k in range(4000))
+    assert len(counts) == 4
+    assert min(counts.values()) > 4000 / 4 / 2
+
+
+def test_removing_an_instance_only_moves_its_keys():
+    four, three = _members(4), _members(3)
+    for k in range(2000):
+        before = _by_hash(four, f"req{k}")["address"]
+        if before != "agent3":
+            assert _by_hash(three, f"req{k}")["address"] == before
+
+
+def test_least_outstanding_counts_unreported_sends():
+    members = _members(2)
+    members[0]["in_flight"] = 1
+    _sent_since_heartbeat.clear()
+    assert _least_outstanding(members)["address"] == "agent1"
+    _sent_since_heartbeat["agent1"] = 2
+    assert _least_outstanding(members)["address"] == "agent0"
+    _sent_since_heartbeat.clear()
+
+
+class FakeRegistry:
+    """One instance whose heartbeats report `in_flight` values in turn, one per poll."""
+
+    def __init__(self, in_flight):
+        self.in_flight = list(in_flight)
+        self.polls = 0
+        self.updates = []
+
+    def update_many(self, query, update):
+        self.updates.append((query, update))
+
+    def find(self, query, projection):
+        value = self.in_flight[min(self.polls, len(self.in_flight) - 1)]
+        self.polls += 1
+        beat = datetime.utcnow() + timedelta(seconds=agent_registry.REGISTRY_HEARTBEAT_SECONDS * self.polls)
+        return [{"in_flight": value, "heartbeat_at": beat}]
+
+
+def test_drain_waits_for_two_idle_heartbeats(monkeypatch):
+    fake = FakeRegistry([2, 0, 1, 0, 0])
+    monkeypatch.setattr(agent_registry, "registry", fake)
+    monkeypatch.setattr(agent_registry.time, "sleep", lambda s: None)
+    assert agent_registry.drain([123], timeout=60) == 0
+    assert fake.polls == 5   # a single idle beat between messages does not end the drain
+    query, update = fake.updates[0]
+    assert query == {"host": agent_registry.HOSTNAME, "pid": {"$in": [123]}}
+    assert update == {"$set": {"status": "draining"}}
+
+
+def test_drain_gives_up_at_the_deadline(monkeypatch):
+    fake = FakeRegistry([3])
+    monkeypatch.setattr(agent_registry, "registry", fake)
+    monkeypatch.setattr(agent_registry.time, "sleep", lambda s: None)
+    assert agent_registry.drain([123], timeout=0) == 3
@@ -0,0 +1,24 @@
+from rapidfuzz import fuzz
+
+from app.catalog_index import FuzzyIndex, ProductIndex
+
+
+def test_spelling_variants_share_a_canonical_form():
+    index = ProductIndex()
+    first = index.add({"product": {"brand": "MONSTER", "product_name": "Mega Monster Energy", "category": "Energy Drink"}})
+    second = index.add({"product": {"brand": "Monster", "product_name": "MEGA MONSTER ENERGY", "category": "energy drinks"}})
+    assert first == second
+    assert first["brand"] == "MONSTER"
+
+
+def test_unrelated_values_are_added_not_matched():
+    index = FuzzyIndex(fuzz.WRatio, 90)
+    assert index.add_many(["Red Bull", "Monster"]) == ["Red Bull", "Monster"]
+    assert index.match_many(["red bull", "Tide", None]) == ["Red Bull", None, None]
+
+
+def test_published_entries_are_always_readable():
+    index = FuzzyIndex(fuzz.WRatio, 90)
+    index._append("Red Bull", "red bull")
+    assert len(index.canonical) == len(index.processed) == len(index._exact) == 1
+    assert all(i < len(index.canonical) for i in index._exact.values())
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.coalesce import Coalescer
+
+
+def test_concurrent_callers_share_one_run():
+    async def scenario():
+        coalescer, calls = Coalescer(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "report"
+
+        results = await asyncio.gather(*(coalescer.run("img", work) for _ in range(3)))
+        return results, calls, coalescer._in_flight
+
+    results, calls, in_flight = asyncio.run(scenario())
+    assert results == ["report"] * 3
+    assert len(calls) == 1
+    assert not in_flight   # finished runs are forgotten
+
+
+def test_one_caller_cancelling_does_not_cancel_the_run():
+    async def scenario():
+        coalescer = Coalescer()
+        done = asyncio.Event()
+
+        async def work():
+            await done.wait()
+            return "report"
+
+        impatient = asyncio.create_task(coalescer.run("img", work))
+        patient = asyncio.create_task(coalescer.run("img", work))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        await asyncio.sleep(0.01)
+        done.set()
+        return await patient, impatient.cancelled()
+
+    assert asyncio.run(scenario()) == ("report", True)
+
+
+def test_failed_run_is_retried_by_the_next_caller():
+    async def scenario():
+        coalescer, attempts = Coalescer(), []
+
+        async def work():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("upstream down")
+            return "report"
+
+        with pytest.raises(RuntimeError):
+            await coalescer.run("img", work)
+        return await coalescer.run("img", work)
+
+    assert asyncio.run(scenario()) == "report"
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app import codec
+from app.codec import pack, unpack
+
+PAYLOAD = {
+    "cleaned_evidence": {"recalls": [{"description": "Voluntary recall", "sources": ["a1b2c3"]}]},
+    "aggregated_answers": ["ünïcode answer", ""],
+    "confidence": 0.7,
+    "flags": [True, None, 3],
+}
+
+
+@pytest.mark.parametrize("encoding", ["json+zlib", "msgpack+zlib", "json+zstd", "msgpack+zstd"])
+def test_round_trip(encoding):
+    body, comp = encoding.split("+")
+    if body == "msgpack" and codec.msgpack is None or comp == "zstd" and codec.zstandard is None:
+        pytest.skip(f"{encoding} not available")
+    data = pack(PAYLOAD, encoding)
+    assert data.startswith(f"{encoding}:")
+    assert unpack(data) == PAYLOAD
+
+
+def test_default_encoding_round_trips():
+    data = pack(PAYLOAD)
+    assert data.startswith(codec.preferred_encoding() + ":")
+    assert unpack(data) == PAYLOAD
+
+
+def test_writer_request_compaction_round_trips():
+    from app.agents import CleanedEvidence, WriterRequest, compact_writer_request, expand_writer_request
+
+    msg = WriterRequest(
+        request_id="req1", callback_url="http://api/webhook", product_name="Mega Monster",
+        cleaned_evidence=CleanedEvidence(**PAYLOAD["cleaned_evidence"]),
+        aggregated_answers=PAYLOAD["aggregated_answers"], all_sources=["a1b2c3"],
+    )
+    compact = asyncio.run(compact_writer_request(msg))
+    assert compact.evidence_blob and not compact.aggregated_answers and not compact.all_sources
+    assert asyncio.run(expand_writer_request(compact)) == msg
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app import agents
+from app.agents import DeepSearchRequest, EvidenceAccumulator
+
+SOURCES = ["s1", "s2", "s3", "s4"]
+
+
+def test_first_answer_scores_its_categories_and_sources():
+    acc = EvidenceAccumulator()
+    assert acc.add("A 2022 recall and a class action lawsuit", SOURCES) == pytest.approx(2.75)
+
+
+def test_same_findings_from_the_same_sources_score_nothing():
+    acc = EvidenceAccumulator()
+    acc.add("A 2022 recall of several lots", SOURCES)
+    assert acc.add("A 2022 recall of several lots", SOURCES) == 0
+
+
+def test_reworded_answer_with_few_new_sources_is_low_gain():
+    acc = EvidenceAccumulator()
+    acc.add("A 2022 recall of several lots", SOURCES)
+    gain = acc.add("The maker recalled cans after a packaging defect", SOURCES[1:] + ["s5"])
+    assert gain == pytest.approx(0.375)
+    assert gain < agents.DEEP_SEARCH_MIN_GAIN
+
+
+def test_failed_search_has_no_gain():
+    acc = EvidenceAccumulator()
+    assert acc.add("Error: upstream perplexity circuit open", []) is None
+    assert acc.add("", []) is None
+    assert not acc.categories and not acc.findings
+
+
+def _request():
+    return DeepSearchRequest(
+        detection_result={
+            "product": {"brand": "MONSTER", "product_name": "MEGA MONSTER ENERGY"},
+            "research_queries": ["Monster recall", "Monster lawsuit", "Monster warning"],
+        },
+        request_id="req1", callback_url="http://api/webhook",
+    )
+
+
+@pytest.fixture
+def run(monkeypatch):
+    async def store(table):
+        return None
+
+    monkeypatch.setattr(agents.source_store, "store", store)
+
+    def run(answers):
+        queries = []
+
+        async def search(query):
+            queries.append(query)
+            return answers[len(queries) - 1]
+
+        writer_request = asyncio.run(agents.run_deep_search(_request(), search=search))
+        return writer_request.search_stats, queries
+
+    return run
+
+
+def test_stops_once_answers_stop_adding_evidence(run):
+    recall = ("A 2022 recall of several lots", SOURCES)
+    reworded = ("The maker recalled cans after a packaging defect", SOURCES)
+    stats, queries = run([recall, reworded, recall])
+    assert stats["stop_reason"] == "low_gain"
+    assert (stats["planned"], stats["run"]) == (3, 2)
+
+
+def test_failed_searches_do_not_count_toward_min_queries(run):
+    failed = ("Perplexity API Error (503): unavailable", [])
+    recall = ("A 2022 recall of several lots", SOURCES)
+    reworded = ("The maker recalled cans after a packaging defect", SOURCES)
+    stats, _ = run([failed, recall, reworded])
+    assert stats["stop_reason"] == "completed"
+    assert stats["run"] == 3
+    assert stats["gains"][0] is None
+
+
+def test_time_budget(run, monkeypatch):
+    monkeypatch.setattr(agents, "DEEP_SEARCH_TIME_BUDGET", 0)
+    stats, queries = run([])
+    assert stats["stop_reason"] == "time_budget"
+    assert queries == []
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app import outbox
+from app.codec import pack
+
+
+class FakeCollection:
+    def __init__(self):
+        self.updates = []
+
+    def update_one(self, query, update):
+        self.updates.append(update["$set"])
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    """Answer webhook POSTs with the status the test sets; record what was sent."""
+    state = {"status": 200, "requests": []}
+
+    def handler(request):
+        state["requests"].append(request)
+        return httpx.Response(state["status"], text="")
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(outbox.httpx, "AsyncClient",
+                        lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw))
+    monkeypatch.setattr(outbox, "outbox", FakeCollection())
+    return state
+
+
+def _entry(attempts=0):
+    return {"_id": 1, "delivery_id": "req1", "callback_url": "http://api/report/webhook/req1",
+            "body": pack({"final_report": {"title": "t"}}), "status": "pending", "attempts": attempts}
+
+
+def _deliver(entry):
+    return asyncio.run(outbox.deliver(entry))
+
+
+def test_acknowledged_delivery(webhook):
+    assert _deliver(_entry()) is True
+    assert webhook["requests"][0].headers["Idempotency-Key"] == "req1"
+    assert outbox.outbox.updates[-1]["status"] == "delivered"
+
+
+@pytest.mark.parametrize("status", [500, 503, 408, 429])
+def test_transient_failure_is_retried_later(webhook, status):
+    webhook["status"] = status
+    assert _deliver(_entry()) is False
+    update = outbox.outbox.updates[-1]
+    assert update["status"] == "pending"
+    assert update["attempts"] == 1
+    assert update["next_attempt_at"] > datetime.utcnow()
+
+
+@pytest.mark.parametrize("status", [400, 404, 410])
+def test_permanent_4xx_fails_at_once(webhook, status):
+    webhook["status"] = status
+    assert _deliver(_entry()) is False
+    assert outbox.outbox.updates[-1]["status"] == "failed"
+
+
+def test_gives_up_after_max_attempts(webhook):
+    webhook["status"] = 503
+    _deliver(_entry(attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1))
+    assert outbox.outbox.updates[-1]["status"] == "failed"
+
+
+def test_finished_entries_are_not_sent_again(webhook):
+    assert _deliver({**_entry(), "status": "delivered"}) is True
+    assert _deliver({**_entry(), "status": "failed"}) is False
+    assert not webhook["requests"]
+
+
+def test_backoff_grows_and_is_capped():
+    assert outbox.OUTBOX_BASE_DELAY * 0.5 <= outbox.backoff(0) <= outbox.OUTBOX_BASE_DELAY
+    assert outbox.backoff(3) <= outbox.OUTBOX_BASE_DELAY * 8
+    assert outbox.backoff(50) <= outbox.OUTBOX_MAX_DELAY
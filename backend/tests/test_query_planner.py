@@ -0,0 +1,35 @@
+from app.query_planner import intents, plan_queries
+
+MONSTER = {"brand": "MONSTER", "product_name": "MEGA MONSTER ENERGY"}
+
+
+def test_near_duplicates_collapse_to_the_most_specific():
+    plan = plan_queries(["Monster Energy recall", "Monster Energy drink recall"], MONSTER, max_queries=5)
+    recall_queries = [q for q in plan if intents(q) == {"recall"}]
+    assert recall_queries == ["Monster Energy drink recall"]
+
+
+def test_missing_intents_get_one_combined_query():
+    plan = plan_queries(["Monster Energy recall"], MONSTER, max_queries=5)
+    assert "MONSTER MEGA ENERGY lawsuit warning" in plan
+    assert set().union(*(intents(q) for q in plan)) == {"recall", "lawsuit", "warning"}
+
+
+def test_cap_never_drops_intent_coverage():
+    queries = [
+        "MONSTER MEGA MONSTER ENERGY lawsuit",
+        "MEGA MONSTER ENERGY ingredients complaint",
+        "Monster Energy drink recall",
+        "Monster Energy recall",
+        "Monster Energy warnings",
+        "Monster Energy adverse events",
+        "070847811169",
+    ]
+    plan = plan_queries(queries, MONSTER, max_queries=3)
+    assert len(plan) == 3
+    assert set().union(*(intents(q) for q in plan)) == {"recall", "lawsuit", "warning"}
+    assert "070847811169" not in plan
+
+
+def test_empty_input_plans_the_combined_query_only():
+    assert plan_queries([], MONSTER) == ["MONSTER MEGA ENERGY recall lawsuit warning"]
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from app import resilience
+from app.resilience import MIN_SAMPLES, CircuitOpen, Policy, UpstreamHealth
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _health(**policy):
+    return UpstreamHealth("test", Policy(**policy))
+
+
+def test_no_hedge_delay_until_enough_samples():
+    h = _health(hedge_min_delay=0.5)
+    for _ in range(MIN_SAMPLES - 1):
+        h.record(True, 2.0)
+    assert h.hedge_delay() is None
+    h.record(True, 2.0)
+    assert h.hedge_delay() == 2.0
+
+
+def test_hedge_delay_has_a_floor():
+    h = _health(hedge_min_delay=1.5)
+    for _ in range(MIN_SAMPLES):
+        h.record(True, 0.1)
+    assert h.hedge_delay() == 1.5
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    h = _health(breaker_failures=3, breaker_reset=30)
+    for _ in range(3):
+        h.allow()
+        h.record(False)
+    assert h.state == "open"
+    with pytest.raises(CircuitOpen) as exc:
+        h.allow()
+    assert exc.value.retry_after == pytest.approx(30)
+
+
+def test_success_resets_the_failure_count():
+    h = _health(breaker_failures=3)
+    h.record(False)
+    h.record(False)
+    h.record(True, 1.0)
+    h.record(False)
+    assert h.state == "closed"
+
+
+def test_half_open_allows_one_probe(clock):
+    h = _health(breaker_failures=1, breaker_reset=30)
+    h.record(False)
+    clock[0] += 31
+    h.allow()
+    assert h.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        h.allow()   # the probe is still out
+    h.record(True, 1.0)
+    assert h.state == "closed"
+
+
+def test_failed_probe_reopens(clock):
+    h = _health(breaker_failures=1, breaker_reset=30)
+    h.record(False)
+    clock[0] += 31
+    h.allow()
+    h.record(False)
+    assert h.state == "open"
+
+
+def test_policy_from_env(monkeypatch):
+    monkeypatch.setenv("RESILIENCE_TEST_HEDGE", "0")
+    monkeypatch.setenv("RESILIENCE_TEST_TIMEOUT", "12.5")
+    monkeypatch.setenv("RESILIENCE_TEST_BREAKER_FAILURES", "7")
+    policy = Policy.from_env("test")
+    assert (policy.hedge, policy.timeout, policy.breaker_failures) == (False, 12.5, 7)
+
+
+def _warm_upstream(monkeypatch, rate, p95):
+    """A perplexity upstream with a known p95 and its own scheduler bucket."""
+    from app import scheduler
+
+    h = UpstreamHealth("perplexity", Policy(hedge_min_delay=p95))
+    h.latencies.extend([p95] * MIN_SAMPLES)
+    monkeypatch.setitem(resilience.health, "perplexity", h)
+    monkeypatch.setitem(scheduler.schedulers, "perplexity", scheduler.UpstreamScheduler("perplexity", rate, 1))
+
+
+def test_time_queued_for_a_token_does_not_trigger_hedges(monkeypatch):
+    # Tokens 50 ms apart, answers in 20 ms, p95 100 ms: eight calls queue for up to
+    # 350 ms, but once sent each answers well within p95
+    _warm_upstream(monkeypatch, rate=20, p95=0.1)
+    sent = []
+
+    async def upstream():
+        sent.append(1)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def scenario():
+        return await asyncio.gather(*(resilience.call("perplexity", upstream) for _ in range(8)))
+
+    hedges = resilience.UPSTREAM_HEDGES.labels(upstream="perplexity", outcome="launched")
+    launched = hedges._value.get()
+    assert asyncio.run(scenario()) == ["ok"] * 8
+    assert hedges._value.get() == launched
+    assert len(sent) == 8
+
+
+def test_slow_upstream_is_hedged_after_p95(monkeypatch):
+    _warm_upstream(monkeypatch, rate=0, p95=0.05)
+    delays = [0.5, 0.01]
+
+    async def upstream():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert asyncio.run(resilience.call("perplexity", upstream)) == 0.01
@@ -0,0 +1,50 @@
+import asyncio
+from collections import deque
+
+import pytest
+
+from app.scheduler import UpstreamScheduler
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def _queue(scheduler, loop, priority, user):
+    fut = loop.create_future()
+    scheduler._queues[priority].setdefault(user, deque()).append(fut)
+    return fut
+
+
+def _drain(scheduler):
+    order = []
+    while (fut := scheduler._next()) is not None:
+        order.append(fut)
+    return order
+
+
+def test_priority_classes_are_served_in_order(loop):
+    s = UpstreamScheduler("test", rate=1, burst=1)
+    warm = _queue(s, loop, "warm", "")
+    batch = _queue(s, loop, "batch", "a")
+    interactive = _queue(s, loop, "interactive", "b")
+    assert _drain(s) == [interactive, batch, warm]
+
+
+def test_users_alternate_within_a_class(loop):
+    s = UpstreamScheduler("test", rate=1, burst=1)
+    a1, a2, a3 = (_queue(s, loop, "batch", "a") for _ in range(3))
+    b1 = _queue(s, loop, "batch", "b")
+    assert _drain(s) == [a1, b1, a2, a3]
+
+
+def test_cancelled_waiters_are_skipped(loop):
+    s = UpstreamScheduler("test", rate=1, burst=1)
+    gone = _queue(s, loop, "interactive", "a")
+    waiting = _queue(s, loop, "interactive", "a")
+    gone.cancel()
+    assert _drain(s) == [waiting]
+    assert not s._pending()
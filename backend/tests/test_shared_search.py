@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from app import agents
+from app.agents import SharedSearch
+
+
+@pytest.fixture
+def perplexity(monkeypatch):
+    """Replace perplexity_search with a slow fake whose answers the test scripts."""
+    calls, answers = [], []
+
+    async def fake(query):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return answers.pop(0) if answers else (f"answer to {query}", ["https://example.com"])
+
+    monkeypatch.setattr(agents, "perplexity_search", fake)
+    return calls, answers
+
+
+def test_same_words_share_one_search(perplexity):
+    calls, _ = perplexity
+
+    async def scenario():
+        shared = SharedSearch()
+        return await asyncio.gather(
+            shared.search("Monster recall"), shared.search("recall monster"), shared.search("Monster lawsuit"),
+        )
+
+    results = asyncio.run(scenario())
+    assert results[0] == results[1]
+    assert calls == ["Monster recall", "Monster lawsuit"]
+
+
+def test_caller_timeout_does_not_cancel_the_search(perplexity):
+    calls, _ = perplexity
+
+    async def scenario():
+        shared = SharedSearch()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(shared.search("Monster recall"), timeout=0.001)
+        return await shared.search("Monster recall")
+
+    assert asyncio.run(scenario())[0] == "answer to Monster recall"
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("failure", [
+    ("Perplexity API Error (503): unavailable", []),
+    ("Error: upstream perplexity circuit open", []),
+])
+def test_failed_answer_is_retried(perplexity, failure):
+    calls, answers = perplexity
+    answers.append(failure)
+
+    async def scenario():
+        shared = SharedSearch()
+        first = await shared.search("Monster recall")
+        await asyncio.sleep(0)   # done callbacks run on the next loop iteration
+        return first, await shared.search("Monster recall")
+
+    first, second = asyncio.run(scenario())
+    assert first == failure
+    assert second[0] == "answer to Monster recall"
+    assert len(calls) == 2
@@ -0,0 +1,20 @@
+import pytest
+
+from app.sources import canonical_url, source_id
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://WWW.FDA.gov/Recalls/", "https://www.fda.gov/Recalls"),
+    ("https://example.com/a?utm_source=x&b=2&a=1#top", "https://example.com/a?a=1&b=2"),
+    ("https://example.com/?fbclid=abc&gclid=def", "https://example.com/"),
+    ("https://example.com", "https://example.com/"),
+    ("  https://example.com/x?q=  ", "https://example.com/x?q="),
+    ("not a url", "not a url"),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+def test_equivalent_urls_share_an_id():
+    assert source_id("https://Example.com/a/?utm_medium=email") == source_id("https://example.com/a")
+    assert source_id("https://example.com/a") != source_id("https://example.com/b")
@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+from app import agents
+from app.agents import CleanedEvidence, WriterRequest
+
+
+def test_scheduling_fields_stay_out_of_the_writer_prompt(monkeypatch):
+    prompts = []
+
+    async def write_summary(payload):
+        prompts.append(payload)
+        return json.dumps({"title": "Risk Summary"})
+
+    async def resolve(ids):
+        return {}
+
+    async def dehydrate_report(report, known):
+        return report
+
+    monkeypatch.setattr(agents, "write_summary", write_summary)
+    monkeypatch.setattr(agents.source_store, "resolve", resolve)
+    monkeypatch.setattr(agents.source_store, "dehydrate_report", dehydrate_report)
+
+    def request(user_id, priority):
+        return WriterRequest(
+            request_id="req1", callback_url="http://api/webhook", product_name="Mega Monster",
+            cleaned_evidence=CleanedEvidence(recalls=[{"description": "recall"}]),
+            priority=priority, user_id=user_id, timings={"gemini_detect": 1.0},
+            traceparent="00-abc-def-01", search_stats={"run": 2},
+        )
+
+    asyncio.run(agents.run_writer(request("alice", "interactive")))
+    asyncio.run(agents.run_writer(request("bob", "batch")))
+
+    assert not agents.WRITER_PROMPT_EXCLUDE & prompts[0].keys()
+    # Same evidence from different users and classes: identical prompts, so one cassette
+    assert prompts[0] == prompts[1]